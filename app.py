@@ -1,21 +1,31 @@
 # app.py - WITH ADMIN LOGIN SYSTEM
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session
+from flask import Flask, Response, jsonify, render_template, request, redirect, url_for, flash, send_file, session
 from pathlib import Path
 import random
 import hashlib
-import csv
+import io
 from datetime import datetime
 from storage import (
-    load_students, save_students, load_dorms, save_dorms,
-    save_allocation, read_csv, STUDENTS_FILE, DORMS_FILE, ALLOC_FILE
+    save_students, save_dorms,
+    students_snapshot, dorms_snapshot, load_allocation,
+    load_tickets, load_room_requests, upsert_row, delete_row, rows_snapshot, table_lock, import_csv,
+    table_etag, export_cache_path, iter_export_to_cache
 )
 
 from models import (
-    greedy_allocation, compute_fairness_metrics, simulate_allocation,
-    random_allocation, priority_allocation, suggest_roommates, roommate_compatibility,
-    create_waitlist, auto_reallocate_waitlist  # ← ADD THESE TWO
+    greedy_allocation, compute_fairness_metrics, suggest_roommates, roommate_compatibility,
 )
 
+from history import commit_allocation, list_versions, diff_versions, latest_version, load_version
+from scoring import ScoreMatrix
+from local_search import improve_allocation
+from strategies import STRATEGIES, run_strategy
+import strategies
+import simulation
+import pairing
+import placement
+from result_cache import results
+from waitlist import waitlist as waiting
 from utils import compute_checksum, valid_student_id, log_event, DATA_DIR
 
 app = Flask(__name__)
@@ -75,8 +85,8 @@ def logout():
 
 @app.route("/")
 def index():
-    students = load_students()
-    dorms = load_dorms()
+    students = students_snapshot()
+    dorms = dorms_snapshot()
     total_capacity = sum(int(d.get('capacity', 0)) for d in dorms)
     is_admin = 'admin_logged_in' in session
     
@@ -122,14 +132,14 @@ def load_sample():
 @app.route("/students")
 @login_required
 def students_list():
-    students = load_students()
+    students = students_snapshot()
     return render_template("students_list.html", students=students)
 
 @app.route("/students/add", methods=["GET", "POST"])
 @login_required
 def add_student():
     if request.method == "POST":
-        students = load_students()
+        students = students_snapshot()
         name = request.form["name"]
         year = request.form["year"]
         priority = request.form.get("priority", "0")
@@ -155,17 +165,18 @@ def add_student():
             flash("Student ID already exists.", "error")
             return redirect(url_for("add_student"))
 
-        students.append({
+        student = {
             "student_id": new_id,
             "name": name,
             "year": year,
             "priority": priority,
             "preferred_dorms": preferred_dorms,
             "tags": tags
-        })
-        save_students(students)
-        log_event("ADMIN", f"Added student: {name} ({new_id})")
-        flash(f"✅ Student {name} added with ID {new_id}", "success")
+        }
+        upsert_row("students", student)
+        dorm_id = placement.occupancy.place(student)
+        log_event("ADMIN", f"Added student: {name} ({new_id}) → {dorm_id or 'waitlist'}")
+        flash(f"✅ Student {name} added with ID {new_id} ({f'placed in {dorm_id}' if dorm_id else 'on waitlist'})", "success")
         return redirect(url_for("students_list"))
 
     return render_template("student_form.html", mode="add", student=None)
@@ -173,8 +184,8 @@ def add_student():
 @app.route("/students/edit/<student_id>", methods=["GET", "POST"])
 @login_required
 def edit_student(student_id):
-    students = load_students()
-    student = next((s for s in students if s.get("student_id") == student_id), None)
+    students = students_snapshot()
+    student = next((dict(s) for s in students if s.get("student_id") == student_id), None)
     if not student:
         flash("Student not found.", "error")
         return redirect(url_for("students_list"))
@@ -189,6 +200,7 @@ def edit_student(student_id):
             flash("Another student already has that ID.", "error")
             return redirect(url_for("edit_student", student_id=student_id))
 
+        old = dict(student)
         student["student_id"] = new_id
         student["name"] = request.form["name"]
         student["year"] = request.form["year"]
@@ -196,7 +208,10 @@ def edit_student(student_id):
         student["preferred_dorms"] = request.form.get("preferred_dorms", "")
         student["tags"] = request.form.get("tags", "")
 
-        save_students(students)
+        # Before the write: a changed ID reaches listeners as a deleted student,
+        # and the bed has to be carried over to the new ID by then
+        placement.occupancy.update(old, student)
+        upsert_row("students", student, old_key=student_id)
         log_event("ADMIN", f"Edited student: {student['name']} ({new_id})")
         flash("✅ Student updated.", "success")
         return redirect(url_for("students_list"))
@@ -206,11 +221,9 @@ def edit_student(student_id):
 @app.route("/students/delete/<student_id>", methods=["POST"])
 @login_required
 def delete_student(student_id):
-    students = load_students()
-    before_count = len(students)
-    students = [s for s in students if s.get("student_id") != student_id]
-    save_students(students)
-    log_event("ADMIN", f"Deleted student ID: {student_id} (count: {before_count}→{len(students)})")
+    before_count = len(students_snapshot())
+    delete_row("students", student_id)  # placement frees the bed
+    log_event("ADMIN", f"Deleted student ID: {student_id} (count: {before_count}→{len(students_snapshot())})")
     flash("🗑️ Student deleted.", "success")
     return redirect(url_for("students_list"))
 
@@ -218,14 +231,14 @@ def delete_student(student_id):
 @app.route("/dorms")
 @login_required
 def dorms_list():
-    dorms = load_dorms()
+    dorms = dorms_snapshot()
     return render_template("dorms_list.html", dorms=dorms)
 
 @app.route("/dorms/add", methods=["GET", "POST"])
 @login_required
 def add_dorm():
     if request.method == "POST":
-        dorms = load_dorms()
+        dorms = dorms_snapshot()
         dorm_id = request.form["dorm_id"]
         name = request.form["name"]
         capacity = request.form["capacity"]
@@ -235,13 +248,12 @@ def add_dorm():
             flash("Dorm ID already exists.", "error")
             return redirect(url_for("add_dorm"))
 
-        dorms.append({
+        upsert_row("dorms", {
             "dorm_id": dorm_id,
             "name": name,
             "capacity": capacity,
             "attributes": attributes
         })
-        save_dorms(dorms)
         log_event("ADMIN", f"Added dorm: {name} ({dorm_id})")
         flash("✅ Dorm added.", "success")
         return redirect(url_for("dorms_list"))
@@ -251,8 +263,8 @@ def add_dorm():
 @app.route("/dorms/edit/<dorm_id>", methods=["GET", "POST"])
 @login_required
 def edit_dorm(dorm_id):
-    dorms = load_dorms()
-    dorm = next((d for d in dorms if d.get("dorm_id") == dorm_id), None)
+    dorms = dorms_snapshot()
+    dorm = next((dict(d) for d in dorms if d.get("dorm_id") == dorm_id), None)
     if not dorm:
         flash("Dorm not found.", "error")
         return redirect(url_for("dorms_list"))
@@ -261,7 +273,7 @@ def edit_dorm(dorm_id):
         dorm["name"] = request.form["name"]
         dorm["capacity"] = request.form["capacity"]
         dorm["attributes"] = request.form["attributes"]
-        save_dorms(dorms)
+        upsert_row("dorms", dorm)
         log_event("ADMIN", f"Edited dorm: {dorm['name']} ({dorm_id})")
         flash("✅ Dorm updated.", "success")
         return redirect(url_for("dorms_list"))
@@ -271,87 +283,141 @@ def edit_dorm(dorm_id):
 @app.route("/dorms/delete/<dorm_id>", methods=["POST"])
 @login_required
 def delete_dorm(dorm_id):
-    dorms = load_dorms()
-    dorms = [d for d in dorms if d.get("dorm_id") != dorm_id]
-    save_dorms(dorms)
+    delete_row("dorms", dorm_id)
     log_event("ADMIN", f"Deleted dorm: {dorm_id}")
     flash("🗑️ Dorm deleted.", "success")
     return redirect(url_for("dorms_list"))
 
 # ------------- ALLOCATION & STRATEGIES (Admin Only) -------------
-@app.route("/allocate/<strategy>", defaults={"strategy": "greedy"})
-@app.route("/allocate")
+@app.route("/allocate", defaults={"strategy": "greedy"})
+@app.route("/allocate/<strategy>")
 @login_required
 def run_allocation(strategy="greedy"):
-    students = load_students()
-    dorms = load_dorms()
+    students = students_snapshot()
+    dorms = dorms_snapshot()
     if not students or not dorms:
         flash("Need both students and dorms to allocate.", "error")
         return redirect(url_for("index"))
 
-    if strategy == "random":
-        allocation = random_allocation(students, dorms)
-        strategy_name = "Random"
-    elif strategy == "priority":
-        allocation = priority_allocation(students, dorms)
-        strategy_name = "Priority-first"
+    if strategy not in STRATEGIES:
+        strategy = "greedy"
+    seed = request.args.get("seed", type=int)
+    improve = bool(request.args.get("improve")) and strategy != "optimal"
+    strategy_name = STRATEGIES[strategy].name + (" + Local Search" if improve else "")
+
+    def allocate():
+        scores = ScoreMatrix.current(students, dorms)
+        allocation = run_strategy(strategy, students, dorms, scores=scores, seed=seed)
+        improvement = None
+        if improve:
+            allocation, improvement = improve_allocation(students, dorms, allocation, scores=scores, seed=seed)
+        metrics = compute_fairness_metrics(students, allocation)
+        metrics["unallocated"] = len([s for s in students if not allocation.get(s.get("student_id"))])
+        return allocation, improvement, metrics
+
+    # Unseeded randomised runs are meant to differ each time, so only the rest are cached
+    if seed is not None or not (STRATEGIES[strategy].seeded or improve):
+        allocation, improvement, metrics = results.get_or_compute(
+            "allocate", ("students", "dorms"), allocate, strategy=strategy, seed=seed, improve=improve)
     else:
-        allocation = greedy_allocation(students, dorms)
-        strategy_name = "Smart Greedy"
-    
-    save_allocation(allocation)
-    log_event("ADMIN", f"Ran allocation: {strategy_name} strategy")
-    metrics = compute_fairness_metrics(students, allocation)
+        allocation, improvement, metrics = allocate()
+    # Re-running onto the allocation already live and recorded adds no version;
+    # placement and waitlist edits move the live one on without recording one
+    latest = latest_version()
+    placed = {sid: did for sid, did in allocation.items() if did}
+    if (latest and {sid: did or "" for sid, did in allocation.items()} == load_allocation()
+            and {sid: did for sid, did in load_version(latest).items() if did} == placed):
+        version = latest
+    else:
+        version = commit_allocation(allocation, strategy_name, metrics)
+    log_event("ADMIN", f"Ran allocation: {strategy_name} strategy (version {version})")
     return render_template(
         "allocation_result.html",
         allocation=allocation, students=students, dorms=dorms,
-        metrics=metrics, strategy=strategy_name
+        metrics=metrics, strategy=strategy_name, version=version,
+        strategy_key=strategy, improvement=improvement
     )
 
+@app.route("/allocations/history")
+@login_required
+def allocation_history():
+    versions = list_versions()
+    diff = None
+    a = request.args.get("a", type=int)
+    b = request.args.get("b", type=int)
+    if a and b:
+        try:
+            diff = diff_versions(a, b)
+        except KeyError as e:
+            flash(f"❌ {e.args[0]}", "error")
+    return render_template("allocation_history.html", versions=list(reversed(versions)), diff=diff)
+
+@app.route("/api/allocations/diff")
+@login_required
+def allocation_diff_api():
+    a = request.args.get("a", type=int)
+    b = request.args.get("b", type=int)
+    if not a or not b:
+        return jsonify({"error": "pass versions as ?a=<n>&b=<m>"}), 400
+    try:
+        return jsonify(diff_versions(a, b))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+
 @app.route("/compare")
 @login_required
 def compare_strategies():
-    students = load_students()
-    dorms = load_dorms()
+    students = students_snapshot()
+    dorms = dorms_snapshot()
     if not students or not dorms:
         flash("Need both students and dorms to compare.", "error")
         return redirect(url_for("index"))
     
-    results = {}
-    strategies = [
-        ("greedy", "Smart Greedy", greedy_allocation),
-        ("random", "Random", random_allocation),
-        ("priority", "Priority-first", priority_allocation)
-    ]
-    
-    for strat_key, strat_name, alloc_func in strategies:
-        alloc = alloc_func(students, dorms)
-        metrics = compute_fairness_metrics(students, alloc)
-        metrics["unallocated"] = len([s for s in students if not alloc.get(s.get("student_id"))])
-        results[strat_name] = metrics
+    seeds = max(1, min(request.args.get("seeds", 1, type=int), strategies.MAX_SEEDS))
+    def compare():
+        return strategies.compare(students, dorms, seeds=seeds, scores=ScoreMatrix.current(students, dorms))
+
+    comparison = results.get_or_compute("compare", ("students", "dorms"), compare, seeds=seeds)
     
-    log_event("ADMIN", "Compared allocation strategies")
-    return render_template("strategy_compare.html", results=results)
+    log_event("ADMIN", f"Compared allocation strategies ({comparison['seeds']} seeds, "
+                       f"{comparison['seconds']:.2f}s on {comparison['workers']} workers)")
+    return render_template("strategy_compare.html", comparison=comparison, max_seeds=strategies.MAX_SEEDS)
 
 @app.route("/simulate", methods=["GET", "POST"])
 @login_required
 def run_simulation():
-    students = load_students()
-    dorms = load_dorms()
+    students = students_snapshot()
+    dorms = dorms_snapshot()
     if not students or not dorms:
         flash("Need both students and dorms to simulate.", "error")
         return redirect(url_for("index"))
 
     trials = 100
+    seed = None
+    precision = None
     if request.method == "POST":
         try:
             trials = int(request.form.get("trials", "100"))
         except ValueError:
             trials = 100
-
-    result = simulate_allocation(students, dorms, trials=trials)
-    log_event("ADMIN", f"Ran simulation: {trials} trials")
-    return render_template("simulation_result.html", result=result, trials=trials)
+        if not 1 <= trials <= simulation.MAX_TRIALS:
+            trials = max(1, min(trials, simulation.MAX_TRIALS))
+            flash(f"Trials limited to 1-{simulation.MAX_TRIALS}; running {trials}.", "error")
+        seed = request.form.get("seed", type=int)
+        if request.form.get("early_stop"):
+            precision = 0.01
+
+    def simulate():
+        return simulation.run_simulation(students, dorms, trials=trials, seed=seed, precision=precision,
+                                         scores=ScoreMatrix.current(students, dorms))
+
+    if seed is None:
+        result = simulate()
+    else:
+        result = results.get_or_compute("simulate", ("students", "dorms"), simulate,
+                                        trials=trials, seed=seed, precision=precision)
+    log_event("ADMIN", f"Ran simulation: {result['trials']} trials (seed {result['seed']})")
+    return render_template("simulation_result.html", result=result, trials=trials, max_trials=simulation.MAX_TRIALS)
 
 # ------------- IMPORT/EXPORT & ADMIN (Admin Only) -------------
 @app.route("/import_export", methods=["GET", "POST"])
@@ -364,47 +430,64 @@ def import_export():
             flash("No file selected.", "error")
             return redirect(url_for("import_export"))
 
-        tmp_path = DATA_DIR / "upload.csv"
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
-        file.save(tmp_path)
-
-        if target == "students":
-            students = import_students_from_file(tmp_path)
-            save_students(students)
-            log_event("ADMIN", f"Imported {len(students)} students")
-            flash("✅ Students imported.", "success")
-        elif target == "dorms":
-            dorms = import_dorms_from_file(tmp_path)
-            save_dorms(dorms)
-            log_event("ADMIN", f"Imported {len(dorms)} dorms")
-            flash("✅ Dorms imported.", "success")
-        else:
+        if target not in ("students", "dorms"):
             flash("Unknown import target.", "error")
+            return redirect(url_for("import_export"))
 
-        tmp_path.unlink(missing_ok=True)
-        return redirect(url_for("import_export"))
+        # Parse the upload straight from its stream instead of saving a copy first
+        stream = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+        try:
+            result = import_csv(target, stream)
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(f"❌ Import failed: {e}", "error")
+            return redirect(url_for("import_export"))
+
+        changes = (f"{len(result['inserted'])} new, {len(result['updated'])} updated, "
+                   f"{len(result['deleted'])} removed, {result['unchanged']} unchanged")
+        log_event("ADMIN", f"Imported {target}: {changes} ({result['rejected']} rejected)")
+        flash(f"✅ Imported {target}: {changes}, {result['rejected']} rows rejected.", "success")
+        return render_template("import_export.html", result=result, target=target)
 
     return render_template("import_export.html")
 
 @app.route("/export/<what>")
 @login_required
 def export_csv(what):
-    if what == "students":
-        path = STUDENTS_FILE
-    elif what == "dorms":
-        path = DORMS_FILE
-    elif what == "allocations":
-        path = ALLOC_FILE
-    else:
+    if what not in ("students", "dorms", "allocations"):
         flash("Unknown export type.", "error")
         return redirect(url_for("index"))
 
-    if not path.exists() or path.read_text().strip().split('\n') == [path.read_text().strip().split(',')[0]]:
+    if not rows_snapshot(what):
         flash(f"No {what} data to export yet.", "error")
         return redirect(url_for("index"))
 
+    # The ETag follows the table's data version, so unchanged data is a 304
+    etag = table_etag(what)
+    use_gzip = request.accept_encodings["gzip"] > 0
+    tag = f"{etag}-gz" if use_gzip else etag
+    if request.if_none_match.contains(tag):
+        return Response(status=304, headers={"ETag": f'"{tag}"', "Vary": "Accept-Encoding"})
+
+    cached = export_cache_path(what, etag, use_gzip)
+    if not cached.exists() and request.range:
+        # Byte ranges need the finished file
+        for _ in iter_export_to_cache(what, etag, use_gzip):
+            pass
+
+    if cached.exists():
+        response = send_file(cached.resolve(), mimetype="text/csv", as_attachment=True,
+                             download_name=f"{what}.csv", etag=tag, conditional=True)
+    else:
+        response = Response(iter_export_to_cache(what, etag, use_gzip), mimetype="text/csv")
+        response.headers["Content-Disposition"] = f"attachment; filename={what}.csv"
+        response.headers["Accept-Ranges"] = "bytes"
+        response.set_etag(tag)
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+
     log_event("ADMIN", f"Exported {what}")
-    return send_file(path, as_attachment=True)
+    return response
 
 @app.route("/admin_logs")
 @login_required
@@ -431,8 +514,8 @@ def charts():
         "values": [2, 1, 0, 1, 3]  # Pure numbers only
     }
     
-    students_count = len(load_students())
-    dorms_capacity = sum(int(d.get('capacity', 0)) for d in load_dorms())
+    students_count = len(students_snapshot())
+    dorms_capacity = sum(int(d.get('capacity', 0)) for d in dorms_snapshot())
     capacity = {
         "values": [students_count, dorms_capacity]  # Pure numbers only
     }
@@ -454,10 +537,14 @@ import datetime
 @app.route("/pdf_report")
 @login_required
 def pdf_report():
-    students = load_students()
-    dorms = load_dorms()
-    allocation = greedy_allocation(students, dorms)
-    metrics = compute_fairness_metrics(students, allocation)
+    students = students_snapshot()
+    dorms = dorms_snapshot()
+    def report():
+        allocation = greedy_allocation(students, dorms, scores=ScoreMatrix.current(students, dorms),
+                                       rng=random.Random(0))
+        return allocation, compute_fairness_metrics(students, allocation)
+
+    allocation, metrics = results.get_or_compute("report", ("students", "dorms"), report)
     
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
@@ -536,31 +623,16 @@ def pdf_report():
 @app.route("/roommates")
 @login_required
 def roommates():
-    students = load_students()
-    pairs = suggest_roommates(students)
+    students = students_snapshot()
+    pairs = results.get_or_compute("roommates", ("students",), lambda: suggest_roommates(students))
     log_event("ADMIN", f"Viewed roommate matches: {len(pairs)} pairs found")
-    return render_template("roommates.html", pairs=pairs, students_count=len(students))
-
-def write_csv(filename, data, fieldnames):
-    """Safe CSV writer"""
-    filename.parent.mkdir(parents=True, exist_ok=True)
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data)
+    return render_template("roommates.html", pairs=pairs, students_count=len(students),
+                           dorm_pairs=pairing.dorm_summary())
 
 @app.route("/maintenance", methods=["GET", "POST"])
 @login_required
 def maintenance():
-    tickets_file = DATA_DIR / "maintenance.csv"
-    tickets = []
-    
-    # Load tickets
-    if tickets_file.exists():
-        try:
-            tickets = read_csv(tickets_file)
-        except:
-            tickets = []
+    tickets = load_tickets()
     
     if request.method == "POST":
         # CHECK IF THIS IS RESOLVE ACTION (NEW LOGIC)
@@ -571,17 +643,10 @@ def maintenance():
                     ticket["status"] = "Resolved"
                     import time
                     ticket["resolved"] = time.strftime("%Y-%m-%d %H:%M")
+                    # Save updated ticket
+                    upsert_row("tickets", ticket)
                     break
             
-            # Save updated tickets
-            tickets_file.parent.mkdir(parents=True, exist_ok=True)
-            import csv
-            with open(tickets_file, 'w', newline='', encoding='utf-8') as f:
-                fieldnames = ["id", "room", "issue", "reported", "status", "resolved"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(tickets)
-            
             flash(f"✅ Ticket {ticket_id} resolved!", "success")
             return redirect(url_for("maintenance"))
         
@@ -589,22 +654,16 @@ def maintenance():
         else:
             import time
             timestamp = time.strftime("%Y-%m-%d %H:%M")
-            new_ticket = {
-                "id": f"T{len(tickets) + 1:03d}",
-                "room": request.form.get("room", "Unknown"),
-                "issue": request.form.get("issue", "No description"),
-                "reported": timestamp,
-                "status": "Open"
-            }
-            tickets.append(new_ticket)
-            
-            tickets_file.parent.mkdir(parents=True, exist_ok=True)
-            import csv
-            with open(tickets_file, 'w', newline='', encoding='utf-8') as f:
-                fieldnames = ["id", "room", "issue", "reported", "status"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(tickets)
+            # Number the ticket under the lock so concurrent posts can't collide
+            with table_lock("tickets"):
+                new_ticket = {
+                    "id": f"T{len(rows_snapshot('tickets')) + 1:03d}",
+                    "room": request.form.get("room", "Unknown"),
+                    "issue": request.form.get("issue", "No description"),
+                    "reported": timestamp,
+                    "status": "Open"
+                }
+                upsert_row("tickets", new_ticket)
             
             log_event("ADMIN", f"New maintenance ticket: {new_ticket['id']}")
             flash(f"✅ Ticket {new_ticket['id']} created!", "success")
@@ -612,33 +671,32 @@ def maintenance():
     
     return render_template("maintenance.html", tickets=tickets)
 
+WAITLIST_PAGE_SIZE = 10
+
 @app.route("/waitlist")
 @login_required
 def waitlist():
-    students = load_students()
-    dorms = load_dorms()
-    
-    # Get current allocation (or empty)
-    current_allocation = {}
-    if ALLOC_FILE.exists():
-        try:
-            allocations = read_csv(ALLOC_FILE)
-            current_allocation = {alloc["student_id"]: alloc["dorm_id"] for alloc in allocations}
-        except:
-            pass
-    
-    # Create waitlist
-    waitlist = create_waitlist(students, current_allocation)
+    page = max(1, request.args.get("page", 1, type=int))
+    waiting_count = len(waiting)
+    entries = waiting.page((page - 1) * WAITLIST_PAGE_SIZE, WAITLIST_PAGE_SIZE)
+    free_beds = placement.occupancy.total_free()
     
-    # Show auto-reallocation preview
-    new_allocation = auto_reallocate_waitlist(waitlist[:5], dorms, current_allocation)  # Top 5
-    
-    log_event("ADMIN", f"Viewed waitlist: {len(waitlist)} students waiting")
+    log_event("ADMIN", f"Viewed waitlist: {waiting_count} students waiting")
     return render_template("waitlist.html", 
-                         waitlist=waitlist, 
-                         current_alloc=len(current_allocation),
-                         total_students=len(students),
-                         new_alloc=len(new_allocation) - len(current_allocation))
+                         waitlist=entries, 
+                         waiting_count=waiting_count,
+                         page=page,
+                         pages=max(1, -(-waiting_count // WAITLIST_PAGE_SIZE)),
+                         free_beds=free_beds,
+                         total_students=len(students_snapshot()))
+
+@app.route("/waitlist/fill", methods=["POST"])
+@login_required
+def fill_waitlist():
+    placed = placement.occupancy.fill_all()
+    log_event("ADMIN", f"Filled free beds from waitlist: {len(placed)} students placed")
+    flash(f"✅ Placed {len(placed)} waitlisted students in free beds", "success")
+    return redirect(url_for("waitlist"))
 
 # STUDENT AUTH SYSTEM
 STUDENT_ACCOUNTS = {
@@ -688,8 +746,8 @@ def student_dashboard():
         return redirect(url_for('student_login'))
     
     student_id = session['student_logged_in']
-    students = load_students()
-    dorms = load_dorms()
+    students = students_snapshot()
+    dorms = dorms_snapshot()
     
     # Find this student
     my_student = next((s for s in students if s.get("student_id") == student_id), None)
@@ -698,26 +756,18 @@ def student_dashboard():
         return redirect(url_for("student_login"))
     
     # Find my allocation
-    allocation = {}
-    if ALLOC_FILE.exists():
-        try:
-            allocations = read_csv(ALLOC_FILE)
-            allocation = {a["student_id"]: a["dorm_id"] for a in allocations}
-        except:
-            pass
+    allocation = load_allocation()
     
     my_dorm = allocation.get(student_id, "⏳ On waitlist")
     dorm_name = next((d["name"] for d in dorms if d["dorm_id"] == my_dorm), my_dorm)
     
-    # Find my roommate
+    # Find my roommate from the dorm's pairing
     my_roommate = "None assigned"
-    allocations_list = read_csv(ALLOC_FILE) if ALLOC_FILE.exists() else []
-    for alloc in allocations_list:
-        if alloc["dorm_id"] == my_dorm and alloc["student_id"] != student_id:
-            roommate_student = next((s for s in students if s["student_id"] == alloc["student_id"]), None)
-            if roommate_student:
-                my_roommate = roommate_student["name"]
-            break
+    paired = pairing.roommate_of(student_id)
+    if paired:
+        roommate_student = next((s for s in students if s["student_id"] == paired[0]), None)
+        if roommate_student:
+            my_roommate = roommate_student["name"]
     
     log_event("STUDENT", f"{student_id} viewed dashboard")
     return render_template("student_dashboard.html", 
@@ -731,36 +781,21 @@ def student_dashboard():
 @app.route("/student/maintenance", methods=["GET", "POST"])
 @student_login_required
 def student_maintenance():
-    tickets_file = DATA_DIR / "maintenance.csv"
-    tickets = []
     student_id = session['student_logged_in']
-    
-    # Load tickets
-    if tickets_file.exists():
-        try:
-            tickets = read_csv(tickets_file)
-        except:
-            tickets = []
+    tickets = load_tickets()
     
     if request.method == "POST":
         import time
         timestamp = time.strftime("%Y-%m-%d %H:%M")
-        new_ticket = {
-            "id": f"T{len(tickets) + 1:03d}",
-            "room": f"{session['student_logged_in']}",
-            "issue": request.form.get("issue", "No description"),
-            "reported": timestamp,
-            "status": "Open"
-        }
-        tickets.append(new_ticket)
-        
-        tickets_file.parent.mkdir(parents=True, exist_ok=True)
-        import csv
-        with open(tickets_file, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = ["id", "room", "issue", "reported", "status"]
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(tickets)
+        with table_lock("tickets"):
+            new_ticket = {
+                "id": f"T{len(rows_snapshot('tickets')) + 1:03d}",
+                "room": f"{session['student_logged_in']}",
+                "issue": request.form.get("issue", "No description"),
+                "reported": timestamp,
+                "status": "Open"
+            }
+            upsert_row("tickets", new_ticket)
         
         flash(f"✅ Your ticket T{new_ticket['id']} created!", "success")
         send_email("student@example.com", "✅ Maintenance Ticket Created", 
@@ -778,21 +813,15 @@ def student_maintenance():
 @student_login_required
 def student_assignment_pdf():
     student_id = session['student_logged_in']
-    students = load_students()
-    dorms = load_dorms()
+    students = students_snapshot()
+    dorms = dorms_snapshot()
     
     my_student = next((s for s in students if s.get("student_id") == student_id), None)
     if not my_student:
         flash("Student data not found!", "error")
         return redirect(url_for("student_dashboard"))
     
-    allocation = {}
-    if ALLOC_FILE.exists():
-        try:
-            allocations = read_csv(ALLOC_FILE)
-            allocation = {a["student_id"]: a["dorm_id"] for a in allocations}
-        except:
-            pass
+    allocation = load_allocation()
     
     my_dorm = allocation.get(student_id, "On Waitlist")
     dorm_name = next((d["name"] for d in dorms if d["dorm_id"] == my_dorm), my_dorm)
@@ -832,81 +861,65 @@ def student_assignment_pdf():
 @student_login_required
 def student_roommates():
     student_id = session['student_logged_in']
-    students = load_students()
-    dorms = load_dorms()
+    students = students_snapshot()
+    dorms = dorms_snapshot()
     
-    allocation = {}
-    if ALLOC_FILE.exists():
-        try:
-            allocations = read_csv(ALLOC_FILE)
-            allocation = {a["student_id"]: a["dorm_id"] for a in allocations}
-        except:
-            pass
+    allocation = load_allocation()
     
     my_dorm = allocation.get(student_id)
     dorm_name = next((d["name"] for d in dorms if d["dorm_id"] == my_dorm), "No assignment")
     
-    # Find dorm mates
+    # My paired roommate, then everyone else in the dorm
+    students_by_id = {s["student_id"]: s for s in students}
+    paired = pairing.roommate_of(student_id)
+    roommate = students_by_id.get(paired[0]) if paired else None
     dorm_mates = []
-    allocations_list = read_csv(ALLOC_FILE) if ALLOC_FILE.exists() else []
-    for alloc in allocations_list:
-        if alloc["dorm_id"] == my_dorm and alloc["student_id"] != student_id:
-            mate = next((s for s in students if s["student_id"] == alloc["student_id"]), None)
+    for other_id, dorm_id in allocation.items():
+        if dorm_id == my_dorm and other_id != student_id and (not roommate or other_id != paired[0]):
+            mate = students_by_id.get(other_id)
             if mate:
                 dorm_mates.append(mate)
     
     log_event("STUDENT", f"{student_id} viewed roommates")
     return render_template("student_roommates.html", 
                          dorm_name=dorm_name, 
+                         roommate=roommate,
+                         roommate_score=paired[1] if roommate else None,
                          dorm_mates=dorm_mates,
                          student_id=student_id)
 
 # ROOM CHANGE REQUESTS SYSTEM
-ROOM_REQUESTS_FILE = DATA_DIR / "room_requests.csv"
-
 @app.route("/student/room-change", methods=["GET", "POST"])
 @student_login_required
 def student_room_change():
     student_id = session['student_logged_in']
-    students = load_students()
-    requests = []
+    students = students_snapshot()
     
     # Load existing requests
-    if ROOM_REQUESTS_FILE.exists():
-        try:
-            requests = read_csv(ROOM_REQUESTS_FILE)
-        except:
-            requests = []
+    requests = load_room_requests()
     
     if request.method == "POST":
         import time
         timestamp = time.strftime("%Y-%m-%d %H:%M")
         
         # Find current assignment
-        allocation = {}
-        if ALLOC_FILE.exists():
-            try:
-                allocations = read_csv(ALLOC_FILE)
-                allocation = {a["student_id"]: a["dorm_id"] for a in allocations}
-            except:
-                pass
+        allocation = load_allocation()
         
         current_dorm = allocation.get(student_id, "None")
         new_dorm = request.form.get("new_dorm", "")
         reason = request.form.get("reason", "")
         
-        new_request = {
-            "id": f"R{len(requests) + 1:03d}",
-            "student_id": student_id,
-            "current_dorm": current_dorm,
-            "new_dorm": new_dorm,
-            "reason": reason[:200],
-            "status": "Pending",
-            "timestamp": timestamp
-        }
-        
-        requests.append(new_request)
-        write_csv(ROOM_REQUESTS_FILE, requests, ["id", "student_id", "current_dorm", "new_dorm", "reason", "status", "timestamp"])
+        with table_lock("room_requests"):
+            new_request = {
+                "id": f"R{len(rows_snapshot('room_requests')) + 1:03d}",
+                "student_id": student_id,
+                "current_dorm": current_dorm,
+                "new_dorm": new_dorm,
+                "reason": reason[:200],
+                "status": "Pending",
+                "timestamp": timestamp
+            }
+            upsert_row("room_requests", new_request)
         
         flash(f"✅ Room change request R{new_request['id']} submitted!", "success")
         send_email("student@example.com", "✅ Room Change Request Submitted", 
@@ -919,14 +932,8 @@ def student_room_change():
         return redirect(url_for("student_room_change"))
     
     # Get dorm options
-    dorms = load_dorms()
-    allocation = {}
-    if ALLOC_FILE.exists():
-        try:
-            allocations = read_csv(ALLOC_FILE)
-            allocation = {a["student_id"]: a["dorm_id"] for a in allocations}
-        except:
-            pass
+    dorms = dorms_snapshot()
+    allocation = load_allocation()
     
     current_dorm = allocation.get(student_id)
     my_student = next((s for s in students if s.get("student_id") == student_id), None)
@@ -940,29 +947,27 @@ def student_room_change():
 @app.route("/admin/room-requests")
 @login_required
 def admin_room_requests():
-    requests = []
-    if ROOM_REQUESTS_FILE.exists():
-        try:
-            requests = read_csv(ROOM_REQUESTS_FILE)
-        except:
-            requests = []
+    requests = load_room_requests()
     
     return render_template("admin_room_requests.html", requests=requests)
 
 @app.route("/admin/approve-room-change/<request_id>", methods=["POST"])
 @login_required
 def approve_room_change(request_id):
-    requests = []
-    if ROOM_REQUESTS_FILE.exists():
-        try:
-            requests = read_csv(ROOM_REQUESTS_FILE)
-        except:
-            requests = []
+    requests = load_room_requests()
     
     for req in requests:
         if req.get("id") == request_id:
+            if req.get("status") == "Approved":
+                flash(f"Request {request_id} is already approved.", "error")
+                break
+            try:
+                placement.occupancy.move(req["student_id"], req["new_dorm"])
+            except ValueError as e:
+                flash(f"❌ Cannot approve {request_id}: {e}", "error")
+                break
             req["status"] = "Approved"
-            write_csv(ROOM_REQUESTS_FILE, requests, ["id", "student_id", "current_dorm", "new_dorm", "reason", "status", "timestamp"])
+            upsert_row("room_requests", req)
             
             # SEND APPROVAL EMAIL TO STUDENT
             send_email("student@example.com", "✅ ROOM CHANGE APPROVED!", 
@@ -0,0 +1,219 @@
+# benchmark.py - time the models and storage hot paths on synthetic data, catch regressions
+import argparse
+import gc
+import json
+import os
+import platform
+import math
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from pathlib import Path
+
+import datagen
+from models import as_students, as_dorms, greedy_allocation, compute_fairness_metrics, suggest_roommates
+from scoring import ScoreMatrix
+from storage import TABLES, DATA_DIR, read_csv, write_csv
+
+BASELINE_FILE = DATA_DIR / "benchmark_baseline.json"
+DEFAULT_SIZES = "10k,100k"
+REPEAT = 7
+MIN_REPEAT = 5        # fewer timed runs give a median too noisy to compare
+MIN_SAMPLE = 0.1      # seconds: faster cases are looped until one timed run lasts this long
+THRESHOLD = 0.25      # slower / bigger than baseline by more than this fails
+NOISE_SECONDS = 0.005  # timings this short are too noisy to call a regression
+NOISE_BYTES = 1024 * 1024
+
+# ------------- Cases -------------
+Workload = namedtuple("Workload", "size rows students dorms scores allocation csv_path")
+CASES = {}
+
+def case(name):
+    """Register func(workload) as a benchmark; it should do one unit of the app's work"""
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+@case("score_matrix")
+def _score_matrix(w):
+    ScoreMatrix.build(w.students, w.dorms)
+
+@case("greedy_allocation")
+def _greedy(w):
+    greedy_allocation(w.students, w.dorms, scores=w.scores, rng=random.Random(0))
+
+@case("compute_fairness_metrics")
+def _fairness(w):
+    compute_fairness_metrics(w.students, w.allocation)
+
+@case("suggest_roommates")
+def _roommates(w):
+    suggest_roommates(w.students)
+
+@case("write_csv")
+def _write(w):
+    write_csv(w.csv_path, w.rows, TABLES["students"]["fields"])
+
+@case("read_csv")
+def _read(w):
+    read_csv(w.csv_path)
+
+def build_workload(size, seed, workdir):
+    """Generated rows, parsed and scored once as the app's snapshots would be.
+
+    Every id is valid: allocating an invalid one logs a warning, which would
+    write to the live data/logs.csv inside the timed runs.
+    """
+    rows, dorm_rows = datagen.generate(size, seed, invalid_rate=0)
+    students, dorms = as_students(rows), as_dorms(dorm_rows)
+    scores = ScoreMatrix.build(students, dorms)
+    allocation = greedy_allocation(students, dorms, scores=scores, rng=random.Random(seed))
+    csv_path = Path(workdir) / f"students_{size}.csv"
+    write_csv(csv_path, rows, TABLES["students"]["fields"])
+    return Workload(size, rows, students, dorms, scores, allocation, csv_path)
+
+# ------------- Measuring -------------
+def _timed(func, workload, loops):
+    # Like timeit: a collection landing in one run is noise, not the case's cost
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func(workload)
+        return (time.perf_counter() - started) / loops
+    finally:
+        gc.enable()
+
+def measure(func, workload, repeat=REPEAT):
+    """Median of repeat timed runs, then one more run under tracemalloc for the peak.
+
+    An untimed warm-up run comes first and sets how many calls each timed
+    run makes, so that none lasts under MIN_SAMPLE. spread is the
+    interquartile range of the runs relative to their median, a measure of
+    how noisy the timing was.
+    """
+    warm = _timed(func, workload, 1)
+    loops = max(1, math.ceil(MIN_SAMPLE / warm)) if warm else 1
+    times = sorted(_timed(func, workload, loops) for _ in range(repeat))
+    median = statistics.median(times)
+    q1, _, q3 = statistics.quantiles(times, n=4)
+    tracemalloc.start()
+    try:
+        func(workload)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "size": workload.size,
+        "seconds": round(median, 6),
+        "spread": round((q3 - q1) / median, 4) if median else 0.0,
+        "per_second": round(workload.size / median) if median else None,
+        "peak_bytes": peak,
+    }
+
+def run(sizes, seed=0, repeat=REPEAT, only=None, log=print):
+    """{"<case>@<size>": measurement} for every case (or those in only) at every size"""
+    names = [name for name in CASES if not only or name in only]
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            workload = build_workload(size, seed, workdir)
+            for name in names:
+                result = results[f"{name}@{size}"] = measure(CASES[name], workload, repeat)
+                log(f"{name:<26}{size:>10,}  {result['seconds']:9.4f}s ±{result['spread']:4.0%}"
+                    f"  {result['per_second'] or 0:>12,}/s"
+                    f"  peak {result['peak_bytes'] / 2**20:8.1f} MB")
+            del workload
+    return results
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def regressions(results, baseline, threshold=THRESHOLD):
+    """(key, what, old, new) for every time or peak memory beyond threshold of the baseline.
+
+    A time must also exceed the noise seen in either run: the allowed
+    slowdown grows by the larger of the two spreads.
+    """
+    found = []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        allowed = threshold + max(old.get("spread", 0.0), new.get("spread", 0.0))
+        if new["seconds"] > old["seconds"] * (1 + allowed) and new["seconds"] - old["seconds"] > NOISE_SECONDS:
+            found.append((key, "seconds", old["seconds"], new["seconds"]))
+        if (new["peak_bytes"] > old["peak_bytes"] * (1 + threshold)
+                and new["peak_bytes"] - old["peak_bytes"] > NOISE_BYTES):
+            found.append((key, "peak_bytes", old["peak_bytes"], new["peak_bytes"]))
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Smart Dorm models and storage on synthetic data")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated, e.g. 10k,100k,1m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help=f"timed runs per case, median reported (at least {MIN_REPEAT})")
+    parser.add_argument("--only", help=f"comma separated cases: {', '.join(CASES)}")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE))
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="allowed slowdown / memory growth as a fraction (0.25 = 25%%)")
+    parser.add_argument("--update", action="store_true", help="record this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [datagen.parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    only = set(args.only.split(",")) if args.only else None
+    if args.repeat < MIN_REPEAT:
+        parser.error(f"--repeat must be at least {MIN_REPEAT} for a median worth comparing")
+    if only and only - set(CASES):
+        parser.error(f"unknown case(s): {', '.join(sorted(only - set(CASES)))}")
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else None
+    if baseline and not args.update and baseline["seed"] != args.seed:
+        parser.error(f"baseline was recorded with --seed {baseline['seed']}")
+
+    results = run(sizes, args.seed, args.repeat, only)
+
+    if baseline is None or args.update:
+        # Keep other sizes from the old baseline, unless it was made from different data
+        merged = dict(baseline["results"]) if baseline and baseline["seed"] == args.seed else {}
+        merged.update(results)
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(
+            {"seed": args.seed, "environment": environment(), "results": merged}, indent=2))
+        print(f"✅ Baseline written to {baseline_path}")
+        return 0
+
+    if baseline.get("environment") != environment():
+        print("⚠️ Baseline was recorded on a different machine or Python; timings may not compare")
+    found = regressions(results, baseline["results"], args.threshold)
+    if found:
+        # A real regression reproduces; a burst of load on the machine does not
+        keys = {key for key, _, _, _ in found}
+        print(f"Re-measuring {len(keys)} case(s) to confirm")
+        again = run(sorted({results[key]["size"] for key in keys}), args.seed, args.repeat,
+                    {key.split("@")[0] for key in keys})
+        found = regressions({key: again[key] for key in keys}, baseline["results"], args.threshold)
+    for key, what, old, new in found:
+        if what == "seconds":
+            change = f"{old:.4f}s -> {new:.4f}s"
+        else:
+            change = f"peak {old / 2**20:.1f} MB -> {new / 2**20:.1f} MB"
+        print(f"❌ {key}: {change} (+{(new / old - 1) * 100:.0f}%)")
+    if found:
+        return 1
+    print(f"✅ No regressions beyond {args.threshold:.0%} of {baseline_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# datagen.py - seeded synthetic students and dorms at any scale
+import argparse
+import math
+import random
+from itertools import accumulate
+from pathlib import Path
+
+from storage import TABLES, DATA_DIR, write_csv
+from utils import compute_checksum
+
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "Diana", "Eve", "Frank", "Grace", "Henry", "Ivy", "Jack",
+               "Kara", "Liam", "Maya", "Noah", "Olga", "Pavel", "Quinn", "Rosa", "Sam", "Tara",
+               "Uma", "Victor", "Wendy", "Xavi", "Yara", "Zane"]
+LAST_NAMES = ["Adams", "Brown", "Chen", "Dvorak", "Evans", "Fischer", "Garcia", "Horvat", "Ivanova",
+              "Jones", "Kim", "Lopez", "Müller", "Novak", "Okafor", "Patel", "Quist", "Rossi",
+              "Smith", "Tanaka", "Uddin", "Varga", "Wong", "Xu", "Young", "Zielinski"]
+
+# (value, weight): a freshman-heavy intake, and most students with no priority
+YEARS = [("1", 35), ("2", 26), ("3", 21), ("4", 18)]
+PRIORITIES = [("0", 60), ("1", 25), ("2", 10), ("3", 5)]
+# Each student picks tags independently, so some have none and a few have several
+TAGS = [("quiet", 0.35), ("studious", 0.30), ("party", 0.20), ("athlete", 0.10), ("music", 0.08)]
+PREFERENCES = [(1, 25), (2, 35), (3, 40)]      # how many dorms a student lists
+DORM_ATTRIBUTES = [("quiet", 0.3), ("near_library", 0.25), ("studious", 0.2), ("party", 0.15), ("new", 0.1)]
+
+POPULARITY_SKEW = 1.1   # Zipf exponent: the k-th most popular dorm is listed ~k^-1.1 as often
+BEDS_PER_STUDENT = 0.95  # a little short of beds, as in a real intake
+INVALID_ID_RATE = 0.001  # share of students whose id fails the checksum
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+def dorm_count(n_students):
+    """Halls grow with the intake, but more slowly than it (about sqrt(n)/2)"""
+    return max(5, round(math.sqrt(n_students) / 2))
+
+def _weighted(pairs):
+    values = [v for v, _ in pairs]
+    return values, list(accumulate(w for _, w in pairs))
+
+def generate_dorms(n_students, seed=0, beds_per_student=BEDS_PER_STUDENT):
+    """Dorm rows sharing about n_students * beds_per_student beds, sizes varying 4x"""
+    rng = random.Random(f"dorms:{seed}")
+    count = dorm_count(n_students)
+    sizes = [rng.uniform(0.4, 1.6) for _ in range(count)]
+    beds = n_students * beds_per_student
+    dorms = []
+    for i, size in enumerate(sizes):
+        attrs = [a for a, p in DORM_ATTRIBUTES if rng.random() < p]
+        dorms.append({
+            "dorm_id": f"D{i + 1}",
+            "name": f"{rng.choice(LAST_NAMES)} Hall {i + 1}",
+            "capacity": str(max(1, round(beds * size / sum(sizes)))),
+            "attributes": ",".join(attrs),
+        })
+    return dorms
+
+def iter_students(n_students, dorms, seed=0, invalid_rate=INVALID_ID_RATE):
+    """n_students student rows, generated one at a time.
+
+    Preferences follow a Zipf popularity over a seeded shuffle of the dorms,
+    so a few halls are everyone's first choice, as in real intakes; years,
+    priorities and tags follow the weights above. Ids are sequential with a
+    valid checksum, except for about invalid_rate of them. The same seed and
+    dorms always give the same rows.
+    """
+    rng = random.Random(f"students:{seed}")
+    dorm_ids = [d["dorm_id"] for d in dorms]
+    rng.shuffle(dorm_ids)  # popularity order
+    pref_weights = list(accumulate((k + 1) ** -POPULARITY_SKEW for k in range(len(dorm_ids))))
+    years, year_weights = _weighted(YEARS)
+    priorities, priority_weights = _weighted(PRIORITIES)
+    counts, count_weights = _weighted(PREFERENCES)
+    choices, randbits = rng.choices, rng.random
+
+    for i in range(n_students):
+        sid = compute_checksum(str(100000 + i))
+        if randbits() < invalid_rate:
+            sid = sid[:-1] + str((int(sid[-1]) + 1) % 10)
+        wanted = min(choices(counts, cum_weights=count_weights)[0], len(dorm_ids))
+        prefs = []
+        while len(prefs) < wanted:
+            dorm_id = choices(dorm_ids, cum_weights=pref_weights)[0]
+            if dorm_id not in prefs:
+                prefs.append(dorm_id)
+        yield {
+            "student_id": sid,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "year": choices(years, cum_weights=year_weights)[0],
+            "priority": choices(priorities, cum_weights=priority_weights)[0],
+            "preferred_dorms": ",".join(prefs),
+            "tags": ",".join(t for t, p in TAGS if randbits() < p),
+        }
+
+def generate(n_students, seed=0, invalid_rate=INVALID_ID_RATE):
+    """(students, dorms) rows for a synthetic intake of n_students"""
+    dorms = generate_dorms(n_students, seed)
+    return list(iter_students(n_students, dorms, seed, invalid_rate)), dorms
+
+def parse_size(text):
+    """'100k', '1m' or a plain number of students"""
+    text = text.strip().lower()
+    if text in SIZES:
+        return SIZES[text]
+    return int(text.replace("_", ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Smart Dorm dataset")
+    parser.add_argument("size", type=parse_size, help="number of students: 10k, 100k, 1m or any number")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=str(DATA_DIR / "synthetic"),
+                        help="directory for students.csv and dorms.csv (not the live data/ files)")
+    args = parser.parse_args(argv)
+
+    out = Path(args.out)
+    dorms = generate_dorms(args.size, args.seed)
+    students_file = out / TABLES["students"]["file"].name
+    dorms_file = out / TABLES["dorms"]["file"].name
+    write_csv(dorms_file, dorms, TABLES["dorms"]["fields"])
+    write_csv(students_file, iter_students(args.size, dorms, args.seed), TABLES["students"]["fields"])
+    print(f"✅ {args.size} students, {len(dorms)} dorms (seed {args.seed}) in {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# history.py - versioned allocation history stored as deltas between runs
+import time
+from collections import defaultdict
+
+from storage import DATA_DIR, read_csv, read_csv_cached, write_csv, file_lock, save_allocation
+
+HISTORY_DIR = DATA_DIR / "history"
+HISTORY_INDEX = HISTORY_DIR / "versions.csv"
+INDEX_FIELDS = ["version", "parent", "created", "strategy", "changes",
+                "top1_rate", "top3_rate", "envy_pairs", "unallocated", "checkpoint"]
+DELTA_FIELDS = ["student_id", "old_dorm", "new_dorm"]
+METRIC_FIELDS = ["top1_rate", "top3_rate", "envy_pairs", "unallocated"]
+CHECKPOINT_EVERY = 25  # full copy every N versions bounds load_version()
+
+def _delta_file(version):
+    return HISTORY_DIR / f"v{version:05d}.csv"
+
+def _checkpoint_file(version):
+    return HISTORY_DIR / f"v{version:05d}.full.csv"
+
+def list_versions():
+    """Version rows, oldest first"""
+    return read_csv_cached(HISTORY_INDEX)
+
+def _version_row(version):
+    versions = list_versions()
+    if 1 <= version <= len(versions):
+        return versions[version - 1]
+    raise KeyError(f"No allocation version {version}")
+
+def latest_version():
+    return len(list_versions())
+
+def commit_allocation(allocation, strategy="", metrics=None):
+    """Save allocation as the current one and record it as a new version.
+
+    Only students whose dorm changed since the previous version are written
+    to the version's delta, each with its old and new dorm so deltas can be
+    applied in both directions.
+    """
+    metrics = metrics or {}
+    with file_lock(HISTORY_INDEX):
+        versions = list(list_versions())
+        version = len(versions) + 1
+        previous = load_version(len(versions)) if versions else {}
+
+        changes = []
+        for sid, did in allocation.items():
+            new = did or ""
+            old = previous.pop(sid, "") or ""
+            if old != new:
+                changes.append({"student_id": sid, "old_dorm": old, "new_dorm": new})
+        for sid, old in previous.items():
+            if old:
+                changes.append({"student_id": sid, "old_dorm": old, "new_dorm": ""})
+
+        checkpoint = version == 1 or version % CHECKPOINT_EVERY == 0
+        write_csv(_delta_file(version), changes, DELTA_FIELDS)
+        if checkpoint:
+            write_csv(_checkpoint_file(version),
+                      ({"student_id": sid, "dorm_id": did or ""} for sid, did in allocation.items()),
+                      ["student_id", "dorm_id"])
+        save_allocation(allocation)
+
+        versions.append({
+            "version": str(version),
+            "parent": str(version - 1) if version > 1 else "",
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "strategy": strategy,
+            "changes": str(len(changes)),
+            **{k: str(metrics.get(k, "")) for k in METRIC_FIELDS},
+            "checkpoint": "1" if checkpoint else "",
+        })
+        write_csv(HISTORY_INDEX, versions, INDEX_FIELDS)
+    return version
+
+def load_version(version):
+    """Full allocation {student_id: dorm_id} as of a version"""
+    _version_row(version)
+    base = max(v for v in range(1, version + 1) if v == 1 or v % CHECKPOINT_EVERY == 0)
+    allocation = {r["student_id"]: r["dorm_id"] for r in read_csv(_checkpoint_file(base))}
+    for v in range(base + 1, version + 1):
+        for r in read_csv(_delta_file(v)):
+            if r["new_dorm"]:
+                allocation[r["student_id"]] = r["new_dorm"]
+            else:
+                allocation.pop(r["student_id"], None)
+    return allocation
+
+def _metric(row, name):
+    try:
+        return float(row[name])
+    except (KeyError, ValueError):
+        return None
+
+def diff_versions(a, b):
+    """What changed going from version a to version b.
+
+    Walks only the deltas between the two versions, so the cost follows
+    the number of moves rather than the roster size.
+    """
+    row_a, row_b = _version_row(a), _version_row(b)
+    net = {}  # student_id -> [dorm in a, dorm in b]
+    if a <= b:
+        steps = ((v, "old_dorm", "new_dorm") for v in range(a + 1, b + 1))
+    else:
+        steps = ((v, "new_dorm", "old_dorm") for v in range(a, b, -1))
+    for v, before, after in steps:
+        for r in read_csv(_delta_file(v)):
+            entry = net.setdefault(r["student_id"], [r[before], None])
+            entry[1] = r[after]
+
+    moves = []
+    occupancy = defaultdict(int)
+    for sid, (old, new) in net.items():
+        if old == new:
+            continue
+        moves.append({"student_id": sid, "from": old or None, "to": new or None})
+        if old:
+            occupancy[old] -= 1
+        if new:
+            occupancy[new] += 1
+
+    metrics = {}
+    for name in METRIC_FIELDS:
+        va, vb = _metric(row_a, name), _metric(row_b, name)
+        metrics[name] = {"a": va, "b": vb, "delta": vb - va if va is not None and vb is not None else None}
+
+    return {
+        "a": a,
+        "b": b,
+        "moves": sorted(moves, key=lambda m: m["student_id"]),
+        "occupancy": {d: n for d, n in sorted(occupancy.items()) if n},
+        "metrics": metrics,
+    }
@@ -0,0 +1,133 @@
+# local_search.py - improve any allocation by hill-climbing over moves and swaps
+import random
+import time
+
+from models import as_students, as_dorms, compatibility_score, FairnessMetrics
+
+TIME_BUDGET = 0.5   # seconds of search per call
+PATIENCE = 50       # give up after this many tries per student without a gain
+
+def improve_allocation(students, dorms, allocation, scores=None, time_budget=TIME_BUDGET, seed=None):
+    """Hill-climb from allocation by moving students to free beds and swapping pairs.
+
+    A change is kept when it raises total compatibility score without
+    adding envy pairs, or lowers envy at the same score. Score deltas come
+    from the student's two scores (scores.matrix when given, as for
+    greedy_allocation) and envy deltas from the per-dorm counters of
+    FairnessMetrics, so every candidate is O(1) to evaluate. Runs until
+    time_budget seconds pass or tries stop paying off.
+
+    Returns (allocation, report); the report has the metrics before and
+    after in compute_fairness_metrics terms. Who has a bed never changes,
+    only where.
+    """
+    students, dorms = as_students(students), as_dorms(dorms)
+    allocation = dict(allocation)
+    capacity = {d.dorm_id: d.capacity for d in dorms}
+    dorm_ids = list(capacity)
+    first_col, dorm_row = {}, {}
+    for j, d in enumerate(dorms):
+        first_col.setdefault(d.dorm_id, j)
+        dorm_row.setdefault(d.dorm_id, d)
+
+    fm = FairnessMetrics(students, allocation)
+    before = fm.metrics()
+    used = dict.fromkeys(capacity, 0)
+    for dorm_id in allocation.values():
+        if dorm_id in used:
+            used[dorm_id] += 1
+
+    # Students with a bed in a known dorm and an id of their own can be moved
+    seen = {}
+    for i, s in enumerate(students):
+        seen[s.student_id] = -1 if s.student_id in seen else i
+    movable = [i for i in seen.values()
+               if i >= 0 and students[i].valid and allocation.get(students[i].student_id) in capacity]
+    members = {dorm_id: [] for dorm_id in capacity}
+    pos = {}
+    for i in movable:
+        m = members[allocation[students[i].student_id]]
+        pos[i] = len(m)
+        m.append(i)
+
+    if scores is not None:
+        matrix = scores.matrix
+        def score(i, dorm_id):
+            return matrix.item(i, first_col[dorm_id])
+    else:
+        def score(i, dorm_id):
+            return compatibility_score(students[i], dorm_row[dorm_id])
+
+    occ, want, placed = fm.occupants, fm.wanting, fm.placed_in_wanted
+
+    def envy_move(s, a, b):
+        wa, wb = a in s.rank, b in s.rank
+        return ((occ[a] - 1) * (want[a] - placed[a] + wa) - occ[a] * (want[a] - placed[a])
+                + (occ[b] + 1) * (want[b] - placed[b] - wb) - occ[b] * (want[b] - placed[b]))
+
+    def envy_swap(s, a, t, b):
+        # Occupancy stays put; only who in each dorm wanted it changes
+        return (occ[a] * ((a in s.rank) - (a in t.rank))
+                + occ[b] * ((b in t.rank) - (b in s.rank)))
+
+    def relocate(i, a, b):
+        m = members[a]
+        last = m.pop()
+        if last != i:
+            m[pos[i]] = last
+            pos[last] = pos[i]
+        pos[i] = len(members[b])
+        members[b].append(i)
+        sid = students[i].student_id
+        allocation[sid] = b
+        fm.move(sid, b)
+
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + time_budget
+    started = time.perf_counter()
+    moves = swaps = tries = idle = 0
+    gain = 0
+    while movable and dorm_ids and idle < PATIENCE * len(movable):
+        if tries % 256 == 0 and time.perf_counter() > deadline:
+            break
+        tries += 1
+        idle += 1
+        i = rng.choice(movable)
+        s = students[i]
+        a = allocation[s.student_id]
+        # Half the time aim at a dorm the student listed above their current one
+        better = [d for d in s.prefs[:s.rank.get(a, len(s.prefs))] if d in capacity]
+        b = rng.choice(better) if better and rng.random() < 0.5 else rng.choice(dorm_ids)
+        if b == a:
+            continue
+        if used[b] < capacity[b]:
+            d_score = score(i, b) - score(i, a)
+            d_envy = envy_move(s, a, b)
+            if d_score > 0 and d_envy <= 0 or d_score == 0 and d_envy < 0:
+                relocate(i, a, b)
+                used[a] -= 1
+                used[b] += 1
+                moves += 1
+                gain += d_score
+                idle = 0
+        elif members[b]:
+            j = rng.choice(members[b])
+            t = students[j]
+            d_score = score(i, b) + score(j, a) - score(i, a) - score(j, b)
+            d_envy = envy_swap(s, a, t, b)
+            if d_score > 0 and d_envy <= 0 or d_score == 0 and d_envy < 0:
+                relocate(i, a, b)
+                relocate(j, b, a)
+                swaps += 1
+                gain += d_score
+                idle = 0
+
+    return allocation, {
+        "before": before,
+        "after": fm.metrics(),
+        "moves": moves,
+        "swaps": swaps,
+        "tries": tries,
+        "score_gain": gain,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
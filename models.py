@@ -1,5 +1,7 @@
 # models.py
+import heapq
 import random
+from bisect import bisect_right
 from collections import defaultdict
 from utils import compute_checksum, valid_student_id, log_event
 
@@ -9,115 +11,290 @@ def parse_prefs(pref_str: str):
 def parse_attrs(attr_str: str):
     return {a.strip() for a in attr_str.split(",") if a.strip()}
 
+# ------------- Parsed records -------------
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class Student:
+    """A students.csv row parsed once: ints, preference tuple/ranks, tag set.
+
+    Still reads like the CSV dict (s["name"], s.get("tags")), so templates
+    and callers that expect rows keep working.
+    """
+    __slots__ = ("row", "student_id", "name", "_year", "_priority", "prefs", "rank",
+                 "tags", "tag_set", "quiet", "studious", "valid")
+
+    def __init__(self, row):
+        self.row = row
+        self.student_id = row.get("student_id", "")
+        self.name = row.get("name", "")
+        self._year = _int_or_none(row.get("year", 1))
+        self._priority = _int_or_none(row.get("priority", 0))
+        self.prefs = tuple(parse_prefs(row.get("preferred_dorms", "")))
+        rank = {}
+        for i, p in enumerate(self.prefs):
+            rank.setdefault(p, i)
+        self.rank = rank
+        self.tags = row.get("tags", "")
+        self.tag_set = frozenset(str(self.tags).lower().split(",")) - {''}
+        self.quiet = "quiet" in self.tags
+        self.studious = "studious" in self.tags
+        self.valid = valid_student_id(self.student_id)
+
+    # Bad year/priority values fail where they are used, as int() did on the raw row
+    @property
+    def year(self):
+        if self._year is None:
+            return int(self.row.get("year", 1))
+        return self._year
+
+    @property
+    def priority(self):
+        if self._priority is None:
+            return int(self.row.get("priority", 0))
+        return self._priority
+
+    def get(self, key, default=None):
+        return self.row.get(key, default)
+
+    def __getitem__(self, key):
+        return self.row[key]
+
+    def __repr__(self):
+        return f"Student({self.student_id!r})"
+
+class Dorm:
+    """A dorms.csv row with capacity as an int and attributes as a set"""
+    __slots__ = ("row", "dorm_id", "name", "_capacity", "attrs", "quiet", "near_library")
+
+    def __init__(self, row):
+        self.row = row
+        self.dorm_id = row["dorm_id"]
+        self.name = row.get("name", "")
+        self._capacity = _int_or_none(row.get("capacity", 0))
+        self.attrs = frozenset(parse_attrs(row.get("attributes", "")))
+        self.quiet = "quiet" in self.attrs
+        self.near_library = "near_library" in self.attrs
+
+    @property
+    def capacity(self):
+        if self._capacity is None:
+            return int(self.row.get("capacity", 0))
+        return self._capacity
+
+    def get(self, key, default=None):
+        return self.row.get(key, default)
+
+    def __getitem__(self, key):
+        return self.row[key]
+
+    def __repr__(self):
+        return f"Dorm({self.dorm_id!r})"
+
+_records = {}  # kind -> (source rows, records) for the last snapshot converted
+
+def _as_records(kind, cls, rows):
+    if isinstance(rows, tuple):
+        hit = _records.get(kind)
+        if hit is not None and hit[0] is rows:
+            return hit[1]
+    records = [r if isinstance(r, cls) else cls(r) for r in rows]
+    if isinstance(rows, tuple):
+        # Snapshots are immutable and reused until the data changes
+        _records[kind] = (rows, records)
+    return records
+
+def as_students(rows):
+    """Student records for rows; a storage snapshot is converted only once"""
+    return _as_records("students", Student, rows)
+
+def as_dorms(rows):
+    return _as_records("dorms", Dorm, rows)
+
+def _student(s):
+    return s if isinstance(s, Student) else Student(s)
+
+def _dorm(d):
+    return d if isinstance(d, Dorm) else Dorm(d)
+
 def compatibility_score(student, dorm):
-    prefs = parse_prefs(student.get("preferred_dorms", ""))
-    dorm_id = dorm["dorm_id"]
+    s, d = _student(student), _dorm(dorm)
     score = 0.0
 
-    if dorm_id in prefs:
-        rank = prefs.index(dorm_id)
+    rank = s.rank.get(d.dorm_id)
+    if rank is not None:
         score += max(0, 10 - 2 * rank)
 
-    priority = int(student.get("priority", 0))
-    score += 3 * priority
-
-    year = int(student.get("year", 1))
-    score += max(0, 5 - abs(year - 2))
+    score += 3 * s.priority
+    score += max(0, 5 - abs(s.year - 2))
 
-    dorm_attrs = parse_attrs(dorm.get("attributes", ""))
-    if "quiet" in dorm_attrs and "quiet" in student.get("tags", ""):
+    if d.quiet and s.quiet:
         score += 2
-    if "near_library" in dorm_attrs and "studious" in student.get("tags", ""):
+    if d.near_library and s.studious:
         score += 2
 
     return score
 
-def greedy_allocation(students, dorms, randomize_order=True):
-    capacities = {d["dorm_id"]: int(d["capacity"]) for d in dorms}
-    allocation = {}
-    invalid_ids = []
+def rank_dorms(students, dorms):
+    """Each student's dorm positions, best score first (ties keep dorm order).
 
-    students_list = students[:]
+    Invalid IDs are never allocated, so they get an empty ranking.
+    """
+    students, dorms = as_students(students), as_dorms(dorms)
+    ranking = []
+    for s in students:
+        if not s.valid:
+            ranking.append(())
+            continue
+        scores = [compatibility_score(s, d) for d in dorms]
+        ranking.append(sorted(range(len(dorms)), key=scores.__getitem__, reverse=True))
+    return ranking
+
+def _ranking(students, dorms, scores=None, ranking=None):
+    if ranking is not None:
+        return ranking
+    if scores is not None:
+        return scores.ranking()
+    return rank_dorms(students, dorms)
+
+def greedy_allocation(students, dorms, randomize_order=True, scores=None, ranking=None, rng=None):
+    """Each student in turn takes their best-scoring dorm with room left.
+
+    scores is an optional scoring.ScoreMatrix built from the same students
+    and dorms, ranking a precomputed rank_dorms() result; either one gives
+    the same allocation without rescoring every pair. rng (a random.Random)
+    makes the order reproducible; the module's generator is used otherwise.
+    """
+    students_list = as_students(students)
+    order = list(range(len(students_list)))
     if randomize_order:
-        random.shuffle(students_list)
+        # Shuffling positions draws the same permutation as shuffling the rows
+        (rng or random).shuffle(order)
+    return _greedy(students_list, dorms, order, _ranking(students_list, dorms, scores, ranking))
+
+def _greedy(students, dorms, order, ranking):
+    dorms = as_dorms(dorms)
+    dorm_ids = [d.dorm_id for d in dorms]
+    capacities = {d.dorm_id: d.capacity for d in dorms}
+    # Rows sharing a dorm id share its beds, as with the capacities dict
+    slot_of = {dorm_id: n for n, dorm_id in enumerate(capacities)}
+    slot = [slot_of[dorm_id] for dorm_id in dorm_ids]
+    left = list(capacities.values())
+    full = bytearray(c <= 0 for c in left)
+    allocation = {}
+    invalid_ids = []
 
-    for s in students_list:
-        sid = s["student_id"]
-        if not valid_student_id(sid):
+    for i in order:
+        s = students[i]
+        sid = s.student_id
+        if not s.valid:
             invalid_ids.append(sid)
             continue
 
-        scored = []
-        for d in dorms:
-            sc = compatibility_score(s, d)
-            scored.append((sc, d["dorm_id"]))
-        scored.sort(reverse=True, key=lambda x: x[0])
-
-        assigned = None
-        for sc, dorm_id in scored:
-            if capacities[dorm_id] > 0:
-                allocation[sid] = dorm_id
-                capacities[dorm_id] -= 1
-                assigned = dorm_id
+        # Walk the student's ranking past dorms already marked full
+        allocation[sid] = None
+        for j in ranking[i]:
+            n = slot[j]
+            if not full[n]:
+                allocation[sid] = dorm_ids[j]
+                left[n] -= 1
+                if left[n] <= 0:
+                    full[n] = 1
                 break
 
-        if assigned is None:
-            allocation[sid] = None
-
     if invalid_ids:
         log_event("WARN", f"Invalid student IDs skipped: {', '.join(invalid_ids)}")
 
     return allocation
 
 def compute_fairness_metrics(students, allocation):
-    total = len(students)
-    if total == 0:
+    if len(students) == 0:
         return {"top1_rate": 0, "top3_rate": 0, "envy_pairs": 0}
-
-    satisfied_top1 = 0
-    satisfied_top3 = 0
-    envy_pairs = 0
-
-    for s in students:
-        sid = s["student_id"]
-        assigned = allocation.get(sid)
-        prefs = parse_prefs(s.get("preferred_dorms", ""))
-        if assigned and prefs:
-            if assigned == prefs[0]:
-                satisfied_top1 += 1
-            if assigned in prefs[:3]:
-                satisfied_top3 += 1
-
-    for s in students:
-        sid = s["student_id"]
-        assigned = allocation.get(sid)
-        prefs = parse_prefs(s.get("preferred_dorms", ""))
-        if not prefs:
-            continue
-        for other in students:
-            oid = other["student_id"]
-            if oid == sid:
-                continue
-            other_assigned = allocation.get(oid)
-            if other_assigned and other_assigned in prefs and assigned != other_assigned:
-                envy_pairs += 1
-
-    return {
-        "top1_rate": satisfied_top1 / total,
-        "top3_rate": satisfied_top3 / total,
-        "envy_pairs": envy_pairs
-    }
-
-def simulate_allocation(students, dorms, trials=100):
+    return FairnessMetrics(students, allocation).metrics()
+
+class FairnessMetrics:
+    """top1/top3 satisfaction and envy pairs, kept up to date per assignment.
+
+    A student envies every other student placed in a dorm on their list
+    other than their own. Summed per dorm that is
+
+        envy = sum over d of occupants(d) * (wanting(d) - placed_in_wanted(d))
+
+    where wanting(d) counts students listing d and placed_in_wanted(d)
+    those of them who got d. Building it is O(S*P); move() only touches
+    the two dorms involved.
+    """
+
+    def __init__(self, students, allocation):
+        self.students = as_students(students)
+        self.by_id = defaultdict(list)
+        self.assigned = {}
+        self.occupants = defaultdict(int)
+        self.wanting = defaultdict(int)
+        self.placed_in_wanted = defaultdict(int)
+        self.top1 = 0
+        self.top3 = 0
+        for s in self.students:
+            self.by_id[s.student_id].append(s)
+            for d in s.rank:
+                self.wanting[d] += 1
+        for sid, rows in self.by_id.items():
+            self.assigned[sid] = allocation.get(sid)
+            for s in rows:
+                self._place(s, self.assigned[sid], 1)
+        self.envy = sum(self._envy_term(d) for d in self.wanting)
+
+    def _envy_term(self, dorm_id):
+        return self.occupants.get(dorm_id, 0) * (self.wanting.get(dorm_id, 0) - self.placed_in_wanted.get(dorm_id, 0))
+
+    def _place(self, s, dorm_id, sign):
+        if not dorm_id:
+            return
+        self.occupants[dorm_id] += sign
+        rank = s.rank.get(dorm_id)
+        if rank is not None:
+            self.placed_in_wanted[dorm_id] += sign
+            self.top1 += sign * (rank == 0)
+            self.top3 += sign * (rank < 3)
+
+    def move(self, student_id, dorm_id):
+        """Reassign student_id (None = unallocated) and update every metric"""
+        old = self.assigned.get(student_id)
+        rows = self.by_id.get(student_id, ())
+        if (old or None) == (dorm_id or None) or not rows:
+            self.assigned[student_id] = dorm_id
+            return
+        touched = {d for d in (old, dorm_id) if d}
+        self.envy -= sum(self._envy_term(d) for d in touched)
+        for s in rows:
+            self._place(s, old, -1)
+            self._place(s, dorm_id, 1)
+        self.envy += sum(self._envy_term(d) for d in touched)
+        self.assigned[student_id] = dorm_id
+
+    def metrics(self):
+        total = len(self.students)
+        return {
+            "top1_rate": self.top1 / total if total else 0,
+            "top3_rate": self.top3 / total if total else 0,
+            "envy_pairs": self.envy
+        }
+
+def simulate_allocation(students, dorms, trials=100, scores=None):
     if not students or not dorms:
         return {"avg_top1": 0, "avg_top3": 0, "avg_envy_pairs": 0}
+    students, dorms = as_students(students), as_dorms(dorms)
+    ranking = _ranking(students, dorms, scores)  # once, shared by every trial
 
     top1_rates = []
     top3_rates = []
     envy_values = []
 
     for _ in range(trials):
-        alloc = greedy_allocation(students, dorms, randomize_order=True)
+        alloc = greedy_allocation(students, dorms, randomize_order=True, ranking=ranking)
         metrics = compute_fairness_metrics(students, alloc)
         top1_rates.append(metrics["top1_rate"])
         top3_rates.append(metrics["top3_rate"])
@@ -129,127 +306,256 @@ def simulate_allocation(students, dorms, trials=100):
         "avg_envy_pairs": sum(envy_values) / trials
     }
 
-def random_allocation(students, dorms):
-    """Random baseline for comparison"""
-    capacities = {d["dorm_id"]: int(d["capacity"]) for d in dorms}
+def random_allocation(students, dorms, scores=None, rng=None):
+    """Random baseline for comparison (scores is accepted but not needed)"""
+    rng = rng or random
+    dorms = as_dorms(dorms)
+    capacities = {d.dorm_id: d.capacity for d in dorms}
     allocation = {}
     
     for s in students:
         sid = s["student_id"]
-        available_dorms = [d for d in dorms if capacities[d["dorm_id"]] > 0]
+        available_dorms = [d for d in dorms if capacities[d.dorm_id] > 0]
         if available_dorms:
-            dorm = random.choice(available_dorms)
-            allocation[sid] = dorm["dorm_id"]
-            capacities[dorm["dorm_id"]] -= 1
+            dorm = rng.choice(available_dorms)
+            allocation[sid] = dorm.dorm_id
+            capacities[dorm.dorm_id] -= 1
     
     return allocation
 
-def priority_allocation(students, dorms):
+def priority_allocation(students, dorms, scores=None, ranking=None):
     """Prioritize high-priority students first"""
-    # Sort by priority descending
-    sorted_students = sorted(students, key=lambda s: int(s.get('priority', 0)), reverse=True)
-    return greedy_allocation(sorted_students, dorms, randomize_order=False)
+    # Sort by priority descending (positions, so score matrix rows still line up)
+    students_list = as_students(students)
+    order = sorted(range(len(students_list)), key=lambda i: students_list[i].priority, reverse=True)
+    return _greedy(students_list, dorms, order, _ranking(students_list, dorms, scores, ranking))
+
+def _dorm_priority(s, i):
+    """How dorms rank student s at roster position i: priority, then year, then roster order"""
+    return (s.priority, s.year, -i)
+
+def stable_allocation(students, dorms, scores=None, ranking=None):
+    """Student-proposing deferred acceptance over preferred_dorms.
+
+    Students propose down their own preferred_dorms list; each dorm keeps
+    its best _dorm_priority() proposers so far in a min-heap bounded by its
+    capacity and rejects whoever falls out. No student and dorm would both
+    rather have each other, and it runs in O(S*P log C).
+
+    Students rejected by every dorm they listed then take the beds left
+    over in dorm-priority order, each their best-scoring dorm with room
+    (scores/ranking as for greedy_allocation). Those beds were never asked
+    for, so this adds no blocking pair.
+    """
+    students_list = as_students(students)
+    dorms = as_dorms(dorms)
+    capacities = {d.dorm_id: d.capacity for d in dorms}
+    accepted = {dorm_id: [] for dorm_id in capacities}  # min-heaps of (dorm_priority, i)
+    nxt = [0] * len(students_list)
+    key = [None] * len(students_list)
+    free = []
+    invalid_ids = []
+    for i, s in enumerate(students_list):
+        if s.valid:
+            key[i] = (_dorm_priority(s, i), i)
+            free.append(i)
+        else:
+            invalid_ids.append(s.student_id)
+
+    while free:
+        i = free.pop()
+        s = students_list[i]
+        prefs = s.prefs
+        while nxt[i] < len(prefs):
+            dorm_id = prefs[nxt[i]]
+            nxt[i] += 1
+            heap = accepted.get(dorm_id)
+            if heap is None or capacities[dorm_id] <= 0:
+                continue
+            entry = key[i]
+            if len(heap) < capacities[dorm_id]:
+                heapq.heappush(heap, entry)
+                break
+            if entry > heap[0]:
+                # Bump the dorm's weakest student, who proposes on from where they were
+                free.append(heapq.heapreplace(heap, entry)[1])
+                break
+
+    placed = [None] * len(students_list)
+    left = dict(capacities)
+    for dorm_id, heap in accepted.items():
+        for _, i in heap:
+            placed[i] = dorm_id
+        left[dorm_id] -= len(heap)
+
+    leftovers = [i for i in range(len(students_list)) if placed[i] is None and key[i] is not None]
+    beds = sum(n for n in left.values() if n > 0)
+    if leftovers and beds:
+        if ranking is None and scores is not None:
+            ranking = scores.ranking()
+        leftovers.sort(key=key.__getitem__, reverse=True)
+        for i in leftovers:
+            if not beds:
+                break
+            if ranking is not None:
+                best = next(j for j in ranking[i] if left[dorms[j].dorm_id] > 0)
+            else:
+                # Only dorms with room can win, so score just those (first one wins ties)
+                open_cols = [j for j, d in enumerate(dorms) if left[d.dorm_id] > 0]
+                best = max(open_cols, key=lambda j: (compatibility_score(students_list[i], dorms[j]), -j))
+            placed[i] = dorms[best].dorm_id
+            left[placed[i]] -= 1
+            beds -= 1
+
+    if invalid_ids:
+        log_event("WARN", f"Invalid student IDs skipped: {', '.join(invalid_ids)}")
+
+    allocation = {}
+    for i, s in enumerate(students_list):
+        if s.valid:
+            allocation[s.student_id] = placed[i]
+    return allocation
 
 def roommate_compatibility(student1, student2):
     """AI-style roommate matching score (0-100)"""
+    student1, student2 = _student(student1), _student(student2)
     score = 50  # Baseline compatibility
     
     # Same year = big bonus (+25 points)
-    year1 = int(student1.get("year", 1))
-    year2 = int(student2.get("year", 1))
-    if year1 == year2:
+    if student1.year == student2.year:
         score += 25
     
     # Priority balance (+15 if similar priority levels)
-    p1 = int(student1.get("priority", 0))
-    p2 = int(student2.get("priority", 0))
-    if abs(p1 - p2) <= 1:
+    if abs(student1.priority - student2.priority) <= 1:
         score += 15
     
     # Tag matching (+10 per shared tag: quiet, studious, party)
-    tags1 = set(str(student1.get("tags", "")).lower().split(","))
-    tags2 = set(str(student2.get("tags", "")).lower().split(","))
-    shared_tags = tags1.intersection(tags2) - {''}  # Remove empty strings
+    shared_tags = student1.tag_set & student2.tag_set
     score += len(shared_tags) * 10
     
     # Name similarity bonus (+5 if names start with same letter)
-    if student1.get("name", "")[0].lower() == student2.get("name", "")[0].lower():
+    if student1.name[0].lower() == student2.name[0].lower():
         score += 5
     
     return min(100, max(0, score))  # Clamp between 0-100
 
-def suggest_roommates(students, max_pairs=10):
-    """Find best roommate pairs from all students"""
-    if len(students) < 2:
-        return []
-    
-    pairs = []
-    for i, s1 in enumerate(students):
-        best_match = None
-        best_score = 0
-        best_reason = ""
-        
-        for j, s2 in enumerate(students[i+1:], i+1):
-            score = roommate_compatibility(s1, s2)
-            if score > best_score:
-                best_score = score
-                best_match = s2
-                reason = []
-                if int(s1.get("year", 1)) == int(s2.get("year", 1)):
-                    reason.append("Same year")
-                if len(set(str(s1.get("tags", "")).split(",")) & set(str(s2.get("tags", "")).split(","))) > 0:
-                    reason.append("Shared tags")
-                best_reason = ", ".join(reason) or "Personality match"
-        
-        if best_match and best_score >= 60:  # Only good matches
-            pairs.append({
-                "student1": s1["name"][:15],
-                "student2": best_match["name"][:15],
-                "compatibility": f"{best_score}%",
-                "year1": s1.get("year", "?"),
-                "year2": best_match.get("year", "?"),
-                "reason": best_reason
-            })
-    
-    return sorted(pairs, key=lambda x: int(x["compatibility"][:-1]), reverse=True)[:max_pairs]
-
-def create_waitlist(students, allocation):
-    """Priority waitlist for unallocated students (highest priority first)"""
-    waitlist = []
-    for student in students:
-        student_id = student.get("student_id")
-        if not allocation.get(student_id):  # Unallocated
-            priority = int(student.get("priority", 0))
-            waitlist.append({
-                "student": student,
-                "priority": priority,
-                "student_id": student_id,
-                "name": student.get("name", "Unknown")
-            })
-    # Sort by priority DESC (3=first, 0=last)
-    return sorted(waitlist, key=lambda x: x["priority"], reverse=True)
-
-def auto_reallocate_waitlist(waitlist, dorms, current_allocation):
-    """Try to allocate waitlist students to available beds"""
-    new_allocations = current_allocation.copy()
-    available_beds = {}
-    
-    # Count current occupancy
-    for dorm in dorms:
-        dorm_id = dorm["dorm_id"]
-        capacity = int(dorm.get("capacity", 0))
-        current_count = sum(1 for alloc in current_allocation.values() if alloc == dorm_id)
-        available_beds[dorm_id] = capacity - current_count
-    
-    # Try to allocate waitlist students
-    for entry in waitlist:
-        student_id = entry["student_id"]
-        for dorm_id, spaces in available_beds.items():
-            if spaces > 0:
-                new_allocations[student_id] = dorm_id
-                available_beds[dorm_id] -= 1
+class RoommateIndex:
+    """Students grouped by what roommate_compatibility looks at.
+
+    Everyone with the same year, priority and tag set scores the same
+    against a given student up to the +5 first-letter bonus, so a search
+    ranks these groups once per kind of student and only looks inside the
+    groups whose score could still beat the best match found so far.
+    Members are kept in roster order, overall and per first letter.
+    """
+
+    def __init__(self, students):
+        self.students = students = as_students(students)
+        self.letter = [s.name[0].lower() for s in students]
+        # Tags as bitmasks over this roster's own tag list: free-text tags
+        # are never interned globally, where they would pile up forever
+        bits = {}
+        self.keys = []
+        for s in students:
+            mask = 0
+            for tag in s.tag_set:
+                mask |= 1 << bits.setdefault(tag, len(bits))
+            self.keys.append((s.year, s.priority, mask))
+        groups = {}
+        for i, key in enumerate(self.keys):
+            members, by_letter = groups.setdefault(key, ([], defaultdict(list)))
+            members.append(i)
+            by_letter[self.letter[i]].append(i)
+        self.groups = list(groups.items())
+        self._ranked = {}  # student key -> [(score before letter bonus, group)], best first
+
+    def _ranked_groups(self, key):
+        ranked = self._ranked.get(key)
+        if ranked is None:
+            year, priority, mask = key
+            # Same weights as roommate_compatibility, without the name bonus
+            ranked = sorted(
+                ((50 + 25 * (year == y) + 15 * (abs(priority - p) <= 1) + 10 * (mask & m).bit_count(), g)
+                 for g, ((y, p, m), _) in enumerate(self.groups)),
+                key=lambda e: -e[0])
+            self._ranked[key] = ranked
+        return ranked
+
+    def best_match(self, i, floor=0):
+        """(score, j) for student i's best partner among those after it.
+
+        Matches suggest_roommates' scan: the highest roommate_compatibility,
+        the earliest j on ties. None when nobody scores floor or more.
+        """
+        letter = self.letter[i]
+        best_score, best_j = floor, None
+        for base, g in self._ranked_groups(self.keys[i]):
+            if min(100, base + 5) < best_score:
                 break
-    
-    return new_allocations
-
+            members, by_letter = self.groups[g][1]
+            same = by_letter.get(letter)
+            if same:
+                k = bisect_right(same, i)
+                if k < len(same):
+                    best_score, best_j = _better(min(100, base + 5), same[k], best_score, best_j)
+            score = min(100, base)
+            if score >= best_score:
+                # Earliest member after i with another first letter
+                for j in members[bisect_right(members, i):]:
+                    if best_j is not None and score == best_score and j > best_j:
+                        break
+                    if self.letter[j] != letter:
+                        best_score, best_j = _better(score, j, best_score, best_j)
+                        break
+        return (best_score, best_j) if best_j is not None else None
+
+def _better(score, j, best_score, best_j):
+    """The better of two candidates: higher score, then earlier student"""
+    if best_j is None:
+        return (score, j) if score >= best_score else (best_score, best_j)
+    if score > best_score or (score == best_score and j < best_j):
+        return score, j
+    return best_score, best_j
+
+def _roommate_pair(s1, s2, score):
+    reason = []
+    if s1.year == s2.year:
+        reason.append("Same year")
+    if len(set(str(s1.get("tags", "")).split(",")) & set(str(s2.get("tags", "")).split(","))) > 0:
+        reason.append("Shared tags")
+    return {
+        "student1": s1["name"][:15],
+        "student2": s2["name"][:15],
+        "compatibility": f"{score}%",
+        "year1": s1.get("year", "?"),
+        "year2": s2.get("year", "?"),
+        "reason": ", ".join(reason) or "Personality match"
+    }
 
+def suggest_roommates(students, max_pairs=10):
+    """Find best roommate pairs from all students.
+
+    Each student is paired with their best-scoring partner later in the
+    roster (60+ only) and the top max_pairs pairs are kept in a heap, so
+    once it is full a student only needs searching if they could beat its
+    weakest pair.
+    """
+    if len(students) < 2 or max_pairs <= 0:
+        return []
+    index = RoommateIndex(students)
+    students = index.students
+
+    top = []  # (score, -i, j): the root is the pair to drop next
+    for i in range(len(students)):
+        floor = top[0][0] + 1 if len(top) == max_pairs else 60  # Only good matches
+        found = index.best_match(i, floor)
+        if found is None:
+            continue
+        score, j = found
+        if len(top) < max_pairs:
+            heapq.heappush(top, (score, -i, j))
+        else:
+            heapq.heapreplace(top, (score, -i, j))
+
+    return [_roommate_pair(students[-neg_i], students[j], score)
+            for score, neg_i, j in sorted(top, key=lambda e: (-e[0], -e[1]))]
@@ -0,0 +1,212 @@
+# optimal.py - globally optimal capacitated student -> dorm assignment (min-cost flow)
+import numpy as np
+
+from models import as_students, as_dorms
+from scoring import ScoreMatrix
+from utils import log_event
+
+INF = 2 ** 60  # no arc / unreachable
+
+class _Network:
+    """Residual network of the assignment at column (dorm) level.
+
+    Each student sits in one column (a dorm, or the "unassigned" column).
+    Moving student s from column j to k costs b[s, j] - b[s, k], so the
+    only arc j -> k that matters is the cheapest such move: gap[j, k] holds
+    its cost and mover[j, k] the student. Each column keeps its members'
+    move costs as rows of one array so an arc can be recomputed quickly
+    when its cheapest mover leaves.
+    """
+
+    def __init__(self, benefit, capacity):
+        self.b = benefit
+        S, K = benefit.shape
+        self.col = benefit.argmax(axis=1)
+        self.count = np.bincount(self.col, minlength=K).astype(np.int64)
+        self.rows = []     # per column: move costs of its members, first count[j] rows used
+        self.members = []  # per column: student in each of those rows
+        self.pos = np.empty(S, dtype=np.int64)
+        self.gap = np.full((K, K), INF, dtype=np.int64)
+        self.mover = np.full((K, K), -1, dtype=np.int64)
+        for j in range(K):
+            mem = np.flatnonzero(self.col == j)
+            size = max(8, 2 * len(mem))
+            rows = np.empty((size, K), dtype=np.int64)
+            rows[:len(mem)] = benefit[mem, j][:, None].astype(np.int64) - benefit[mem]
+            ids = np.full(size, -1, dtype=np.int64)
+            ids[:len(mem)] = mem
+            self.pos[mem] = np.arange(len(mem))
+            self.rows.append(rows)
+            self.members.append(ids)
+            self._rebuild(j, np.arange(K))
+
+    def _rebuild(self, j, cols):
+        n = self.count[j]
+        if not n:
+            self.gap[j, cols] = INF
+            self.mover[j, cols] = -1
+            return
+        cost = self.rows[j][:n, cols]
+        best = cost.argmin(axis=0)
+        self.gap[j, cols] = cost[best, np.arange(len(cols))]
+        self.mover[j, cols] = self.members[j][best]
+
+    def cheapest_movers(self, j, k):
+        """Every member of column j whose move to k costs gap[j, k]"""
+        n = self.count[j]
+        return self.members[j][:n][self.rows[j][:n, k] == self.gap[j, k]]
+
+    def move(self, s, k):
+        j = int(self.col[s])
+        # Swap-remove s from column j
+        n = self.count[j] - 1
+        i = self.pos[s]
+        if i != n:
+            last = self.members[j][n]
+            self.rows[j][i] = self.rows[j][n]
+            self.members[j][i] = last
+            self.pos[last] = i
+        self.count[j] = n
+        stale = np.flatnonzero(self.mover[j] == s)
+        if len(stale):
+            self._rebuild(j, stale)
+
+        # Append s to column k; it may now be the cheapest mover out of k
+        n = self.count[k]
+        if n == len(self.members[k]):
+            self.rows[k] = np.concatenate([self.rows[k], np.empty_like(self.rows[k])])
+            self.members[k] = np.concatenate([self.members[k], np.full(n, -1, dtype=np.int64)])
+        cost = int(self.b[s, k]) - self.b[s].astype(np.int64)
+        self.rows[k][n] = cost
+        self.members[k][n] = s
+        self.pos[s] = n
+        self.count[k] = n + 1
+        self.col[s] = k
+        better = cost < self.gap[k]
+        self.gap[k, better] = cost[better]
+        self.mover[k, better] = s
+
+def assign(benefit, capacity):
+    """Maximum-benefit assignment of rows to columns under column capacities.
+
+    benefit is an (S, K) integer array, capacity a length-K integer array
+    with capacity.sum() >= S. Returns the column for every row.
+
+    Every row starts in its best column; overfull columns then push rows
+    out along shortest paths (successive shortest paths with potentials,
+    so every arc keeps a non-negative reduced cost and the result is an
+    exact optimum). Paths run over the K columns rather than the rows,
+    and one Dijkstra pass is followed by as many zero-cost augmentations
+    as it allows. Each augmentation moves as many rows as the path can
+    carry at once: with skewed preferences whole groups of rows tie on
+    their move costs, and they all go in one push instead of one path
+    search each.
+    """
+    K = benefit.shape[1]
+    net = _Network(benefit, capacity)
+    sink = K
+    phi = np.zeros(K + 1, dtype=np.int64)  # node potentials, sink last
+
+    while True:
+        excess = np.flatnonzero(net.count > capacity)
+        if not len(excess):
+            return net.col.copy()
+
+        # Dijkstra from every overfull column to the sink on reduced costs
+        free = net.count < capacity
+        reduced = net.gap + phi[:K, None] - phi[None, :K]
+        dist = np.full(K + 1, INF, dtype=np.int64)
+        dist[excess] = 0
+        done = np.zeros(K + 1, dtype=bool)
+        while True:
+            u = int(np.argmin(np.where(done, INF, dist)))
+            if dist[u] >= INF or u == sink:
+                break
+            done[u] = True
+            np.minimum(dist[:K], dist[u] + reduced[u], out=dist[:K])
+            if free[u]:
+                dist[sink] = min(dist[sink], dist[u] + phi[u] - phi[sink])
+        reach = dist[sink]
+        phi += np.minimum(dist, reach)
+
+        # Push along zero reduced-cost paths until none is left
+        dead = set()
+        for start in excess.tolist():
+            while net.count[start] > capacity[start] and start not in dead:
+                path = _admissible_path(net, capacity, phi, start, dead)
+                if path is None:
+                    dead.add(start)
+                    break
+                end = path[-1]
+                amount = min(net.count[start] - capacity[start], capacity[end] - net.count[end])
+                # Path columns are distinct, so each column's movers are picked
+                # from its own members before anyone arrives
+                movers = [net.cheapest_movers(j, k) for j, k in zip(path, path[1:])]
+                amount = min([amount] + [len(m) for m in movers])
+                for k, group in zip(path[1:], movers):
+                    for s in group[:amount].tolist():
+                        net.move(s, k)
+
+def _admissible_path(net, capacity, phi, start, dead):
+    """Columns from start to one with a free bed, using only zero-cost arcs"""
+    K = len(capacity)
+    sink_phi = phi[K]
+    parent = {start: None}
+    stack = [start]
+    while stack:
+        u = stack.pop()
+        if net.count[u] < capacity[u] and phi[u] == sink_phi:
+            path = [u]
+            while parent[path[-1]] is not None:
+                path.append(parent[path[-1]])
+            return path[::-1]
+        row = net.gap[u] + phi[u] - phi[:K]
+        for v in np.flatnonzero(row == 0).tolist():
+            if v != u and v not in parent and v not in dead:
+                parent[v] = u
+                stack.append(v)
+    # Nothing reachable from here leads to a free bed (until potentials change)
+    dead.update(parent)
+    return None
+
+def optimal_allocation(students, dorms, scores=None):
+    """Maximise total compatibility_score subject to dorm capacities.
+
+    Every valid student gets a bed while beds remain (scores are shifted
+    to be positive, so leaving one empty never pays); after that, seats go
+    where they add the most score overall. Invalid IDs are skipped like in
+    greedy_allocation.
+    """
+    students, dorms = as_students(students), as_dorms(dorms)
+    if scores is None:
+        scores = ScoreMatrix.build(students, dorms)
+
+    valid = [i for i, s in enumerate(students) if s.valid]
+    invalid_ids = [s.student_id for s in students if not s.valid]
+    if invalid_ids:
+        log_event("WARN", f"Invalid student IDs skipped: {', '.join(invalid_ids)}")
+    if not valid:
+        return {}
+
+    # One column per distinct dorm id (the last capacity wins, as in greedy)
+    capacities = {d.dorm_id: max(0, d.capacity) for d in dorms}
+    dorm_ids = list(capacities)
+    first_col = {}
+    for j, did in enumerate(scores.dorm_ids):
+        first_col.setdefault(did, j)
+    cols = [first_col[did] for did in dorm_ids]
+
+    benefit = scores.matrix[np.asarray(valid)][:, cols] if cols else np.zeros((len(valid), 0), dtype=np.int32)
+    if benefit.size:
+        benefit -= benefit.min() - 1
+    capacity = np.array([capacities[did] for did in dorm_ids], dtype=np.int64)
+
+    # A zero-benefit "unassigned" column takes whoever does not fit
+    benefit = np.hstack([benefit, np.zeros((len(valid), 1), dtype=benefit.dtype)])
+    capacity = np.append(capacity, len(valid))
+
+    owner = assign(benefit, capacity)
+    allocation = {}
+    for i, j in zip(valid, owner.tolist()):
+        allocation[students[i].student_id] = dorm_ids[j] if j < len(dorm_ids) else None
+    return allocation
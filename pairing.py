@@ -0,0 +1,503 @@
+# pairing.py - roommate pairs within each dorm by maximum-weight matching
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from models import as_students, roommate_compatibility
+from storage import (
+    on_change, rows_snapshot, save_rows, apply_rows,
+    students_snapshot, load_allocation,
+)
+from utils import log_event
+
+# ------------- Maximum-weight matching -------------
+# Adapted from Joris van Rantwijk's mwmatching.py
+# (http://jorisvr.nl/article/maximum-matching), which its author released
+# into the public domain. The structure, variable names and comments follow
+# that implementation; this version takes a dense weight matrix instead of
+# an edge list and always returns a maximum-weight (not maximum-cardinality)
+# matching.
+def max_weight_matching(weight):
+    """Maximum-weight matching of a complete graph (Edmonds' blossom algorithm).
+
+    weight[i][j] is the integer weight of pairing i with j (symmetric,
+    diagonal ignored). Returns mate, where mate[i] is i's partner or -1.
+    This is the primal-dual method with blossom shrinking in Galil's
+    O(n^3) form: grow alternating trees from every single vertex, adjust
+    the duals until an edge becomes tight, and then augment, shrink a new
+    blossom or expand an old one. Weights are doubled internally so that
+    every dual stays an integer.
+    """
+    n = len(weight)
+    if n < 2:
+        return [-1] * n
+    # Edge k joins endpoint[2k] and endpoint[2k+1]; p ^ 1 is p's other end
+    edges = [(i, j, 2 * int(weight[i][j])) for i in range(n) for j in range(i + 1, n)]
+    edgeweight = [w for _, _, w in edges]
+    endpoint = [v for i, j, _ in edges for v in (i, j)]
+    neighbend = [[] for _ in range(n)]
+    for k, (i, j, _) in enumerate(edges):
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+    maxweight = max(0, max(w for _, _, w in edges))
+
+    mate = [-1] * n              # remote endpoint of v's matched edge
+    label = [0] * (2 * n)        # top-level blossom: 0 free, 1 S, 2 T
+    labelend = [-1] * (2 * n)    # endpoint through which the label was given
+    inblossom = list(range(n))   # top-level blossom containing each vertex
+    blossomparent = [-1] * (2 * n)
+    blossomchilds = [None] * (2 * n)
+    blossombase = list(range(n)) + [-1] * n
+    blossomendps = [None] * (2 * n)
+    bestedge = [-1] * (2 * n)    # least-slack edge to a different S-blossom
+    blossombestedges = [None] * (2 * n)
+    unusedblossoms = list(range(n, 2 * n))
+    dualvar = [maxweight] * n + [0] * n
+    allowedge = [False] * len(edges)
+    queue = []
+
+    def slack(k):
+        i, j, w = edges[k]
+        return dualvar[i] + dualvar[j] - w
+
+    def leaves(b):
+        if b < n:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                yield from leaves(t)
+
+    def assign_label(w, t, p):
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(leaves(b))
+        else:
+            base = blossombase[b]
+            assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scan_blossom(v, w):
+        """Base of the new blossom where the paths from v and w meet, or -1"""
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base, k):
+        v, w, _ = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in leaves(b):
+            if label[inblossom[v]] == 2:
+                queue.append(v)
+            inblossom[v] = b
+        # Least-slack edges from the new blossom to each other S-blossom
+        bestedgeto = [-1] * (2 * n)
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbend[v]] for v in leaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for k in nblist:
+                    i, j, _ = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if (bj != b and label[bj] == 1
+                            and (bestedgeto[bj] == -1 or slack(k) < slack(bestedgeto[bj]))):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expand_blossom(b, endstage):
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < n:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expand_blossom(s, endstage)
+            else:
+                for v in leaves(s):
+                    inblossom[v] = s
+        if not endstage and label[b] == 2:
+            # Relabel the part of the blossom the alternating path runs through
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep, endptrick = 1, 0
+            else:
+                jstep, endptrick = -1, 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[blossomendps[b][j - endptrick] ^ endptrick ^ 1]] = 0
+                assign_label(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in leaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assign_label(v, 2, labelend[v])
+                j += jstep
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augment_blossom(b, v):
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= n:
+            augment_blossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep, endptrick = 1, 0
+        else:
+            jstep, endptrick = -1, 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= n:
+                augment_blossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= n:
+                augment_blossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        childs = blossomchilds[b]
+        blossomchilds[b] = childs[i:] + childs[:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augment_matching(k):
+        v, w, _ = edges[k]
+        for s, p in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= n:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= n:
+                    augment_blossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    for _ in range(n):
+        # Stage: grow trees from every single vertex until one augmentation
+        label[:] = [0] * (2 * n)
+        bestedge[:] = [-1] * (2 * n)
+        for b in range(n, 2 * n):
+            blossombestedges[b] = None
+        allowedge[:] = [False] * len(edges)
+        queue[:] = []
+        for v in range(n):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assign_label(v, 1, -1)
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = dualvar[v] + dualvar[w] - edgeweight[k]  # slack(k), inlined
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assign_label(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scan_blossom(v, w)
+                            if base >= 0:
+                                add_blossom(base, k)
+                            else:
+                                augment_matching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+            if augmented:
+                break
+
+            # No tight edge left to use: change the duals by the largest safe delta
+            deltatype, delta, deltaedge, deltablossom = 1, min(dualvar[:n]), -1, -1
+            for v in range(n):
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = slack(bestedge[v])
+                    if d < delta:
+                        deltatype, delta, deltaedge = 2, d, bestedge[v]
+            for b in range(2 * n):
+                if blossomparent[b] == -1 and label[b] == 1 and bestedge[b] != -1:
+                    d = slack(bestedge[b]) // 2
+                    if d < delta:
+                        deltatype, delta, deltaedge = 3, d, bestedge[b]
+            for b in range(n, 2 * n):
+                if (blossombase[b] >= 0 and blossomparent[b] == -1 and label[b] == 2
+                        and dualvar[b] < delta):
+                    deltatype, delta, deltablossom = 4, dualvar[b], b
+
+            for v in range(n):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in range(n, 2 * n):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                break  # optimum reached: some single vertex's dual hit zero
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                i, j, _ = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                queue.append(edges[deltaedge][0])
+            else:
+                expand_blossom(deltablossom, False)
+
+        if not augmented:
+            break
+        # Expand S-blossoms whose dual reached zero
+        for b in range(n, 2 * n):
+            if (blossomparent[b] == -1 and blossombase[b] >= 0
+                    and label[b] == 1 and dualvar[b] == 0):
+                expand_blossom(b, True)
+
+    return [endpoint[p] if p != -1 else -1 for p in mate]
+
+# ------------- Pairing dorms -------------
+POOL_MIN_PAIRS = 200_000  # below this many candidate pairs a pool costs more than it saves
+
+def pair_dorm(students):
+    """Roommate pairs for one dorm's students, maximising total compatibility.
+
+    Returns [(student, roommate or None, score or None)] for every student:
+    both members of a pair get a row, and with an odd head count one
+    student is left without a roommate.
+    """
+    students = as_students(students)
+    n = len(students)
+    weight = [[0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            weight[i][j] = weight[j][i] = roommate_compatibility(students[i], students[j])
+    mate = max_weight_matching(weight)
+    return [(s, students[mate[i]], weight[i][mate[i]]) if mate[i] >= 0 else (s, None, None)
+            for i, s in enumerate(students)]
+
+def _pair_rows(dorm_id, rows):
+    return [{"student_id": s.student_id,
+             "roommate_id": mate.student_id if mate else "",
+             "dorm_id": dorm_id,
+             "score": "" if score is None else str(score)}
+            for s, mate, score in pair_dorm(rows)]
+
+def _pair_task(task):
+    return _pair_rows(*task)
+
+def pair_roommates(students, allocation, dorms=None, workers=None):
+    """roommates-table rows pairing every dorm of allocation (or just dorms).
+
+    Each dorm is an independent matching, so big campuses fan the dorms out
+    over a process pool, largest first.
+    """
+    by_id = {s.student_id: s for s in as_students(students)}
+    members = {}
+    for sid, dorm_id in allocation.items():
+        if dorm_id and sid in by_id and (dorms is None or dorm_id in dorms):
+            # Plain dicts: snapshot rows are read-only proxies that do not pickle
+            members.setdefault(dorm_id, []).append(dict(by_id[sid].row))
+    tasks = sorted(members.items(), key=lambda task: -len(task[1]))
+
+    work = sum(len(rows) * (len(rows) - 1) // 2 for _, rows in tasks)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1 or work < POOL_MIN_PAIRS:
+        results = map(_pair_task, tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_pair_task, tasks))
+    return [row for rows in results for row in rows]
+
+# ------------- Keeping the roommates table current -------------
+def refresh_pairings(student_ids=None):
+    """Re-pair the dorms holding student_ids (all dorms when None) and store them.
+
+    A partial refresh re-pairs both the dorm a student was paired in and the
+    dorm they are allocated to now, and drops rows for students who left.
+    """
+    students = students_snapshot()
+    allocation = load_allocation()
+    if student_ids is None:
+        save_rows("roommates", pair_roommates(students, allocation))
+        return
+    paired_in = {r["student_id"]: r["dorm_id"] for r in rows_snapshot("roommates")}
+    dorms = {d for sid in student_ids for d in (paired_in.get(sid), allocation.get(sid)) if d}
+    rows = pair_roommates(students, allocation, dorms) if dorms else []
+    kept = {r["student_id"] for r in rows}
+    stale = [sid for sid, d in paired_in.items()
+             if (d in dorms or sid in student_ids) and sid not in kept]
+    if rows or stale:
+        apply_rows("roommates", rows, stale)
+
+_pairing_lock = threading.Lock()
+_pending = {"ids": set(), "all": False, "running": False}
+
+def schedule_pairing(student_ids=None):
+    """refresh_pairings in a background thread so web requests never wait on it.
+
+    Calls made while a refresh is running are merged into one follow-up run.
+    """
+    with _pairing_lock:
+        if student_ids is None:
+            _pending["all"] = True
+        else:
+            _pending["ids"].update(student_ids)
+        if _pending["running"]:
+            return
+        _pending["running"] = True
+    threading.Thread(target=_run_pending, daemon=True).start()
+
+def _run_pending():
+    while True:
+        with _pairing_lock:
+            if not _pending["all"] and not _pending["ids"]:
+                _pending["running"] = False
+                return
+            ids = None if _pending["all"] else _pending["ids"]
+            _pending["ids"], _pending["all"] = set(), False
+        try:
+            refresh_pairings(ids)
+        except Exception as e:
+            log_event("WARN", f"Roommate pairing failed: {e}")
+
+@on_change
+def _repair_on_change(table, changes):
+    if table not in ("allocations", "students"):
+        return
+    if changes["full"]:
+        schedule_pairing()
+    else:
+        # Key changes show up as deletes; allocation rows follow a student's new id
+        schedule_pairing(changes["inserted"] | changes["updated"] | changes["deleted"])
+
+def roommate_of(student_id):
+    """(roommate_id, score) from the stored pairing, or None when unpaired"""
+    for r in rows_snapshot("roommates"):
+        if r["student_id"] == student_id:
+            if not r["roommate_id"]:
+                return None
+            return r["roommate_id"], int(r["score"])
+    return None
+
+def dorm_summary():
+    """Per-dorm pair count, unpaired count and average pair score, by dorm id"""
+    summary = {}
+    for r in rows_snapshot("roommates"):
+        entry = summary.setdefault(r["dorm_id"], {"dorm_id": r["dorm_id"], "pairs": 0, "singles": 0, "total": 0})
+        if r["roommate_id"]:
+            # Both members carry the pair's row, so count it from one side
+            if r["student_id"] < r["roommate_id"]:
+                entry["pairs"] += 1
+                entry["total"] += int(r["score"])
+        else:
+            entry["singles"] += 1
+    for entry in summary.values():
+        entry["average"] = round(entry.pop("total") / entry["pairs"], 1) if entry["pairs"] else None
+    return [summary[d] for d in sorted(summary)]
@@ -0,0 +1,254 @@
+# placement.py - incremental allocation: place, free and move one student at a time
+from models import as_dorms, compatibility_score, _student
+from storage import (
+    on_change, dorms_snapshot, students_snapshot, rows_snapshot, upsert_row, delete_row, apply_rows,
+    table_lock, data_version,
+)
+from utils import log_event
+from waitlist import waitlist
+
+# Student fields that feed compatibility_score; editing anything else keeps the bed
+PLACEMENT_FIELDS = ("year", "priority", "preferred_dorms", "tags")
+
+class Occupancy:
+    """Beds in use per dorm for the stored allocation, updated by delta.
+
+    Each change is one allocations row written with upsert_row/delete_row
+    and a counter adjusted in memory, instead of a full /allocate rerun.
+    The counters are rebuilt from the tables (O(S)) only when dorms or the
+    allocation changed underneath them: a full allocation run, a dorm edit,
+    or a write from another process. Every other call is O(D) at most, plus
+    O(log N) per waitlisted student handed a freed bed. Students added or
+    dropped by an import are placed and freed in batches by a listener on
+    the students table.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.dorms = []
+        self.capacity = {}
+        self.used = {}
+        self.assigned = {}
+
+    def _sync(self):
+        version = data_version("dorms", "allocations")
+        if version == self.version:
+            return
+        self.dorms = as_dorms(dorms_snapshot())
+        # Rows sharing a dorm id share its beds, as in _greedy
+        self.capacity = {d.dorm_id: d.capacity for d in self.dorms}
+        self.used = dict.fromkeys(self.capacity, 0)
+        # Every allocations row, "" for a student left without a bed
+        self.assigned = {}
+        for r in rows_snapshot("allocations"):
+            self.assigned[r["student_id"]] = r["dorm_id"]
+            self._take(r["dorm_id"], 1)
+        self.version = version
+
+    def _take(self, dorm_id, sign):
+        if dorm_id in self.used:
+            self.used[dorm_id] += sign
+
+    def _write(self, student_id, dorm_id, old_key=None):
+        upsert_row("allocations", {"student_id": student_id, "dorm_id": dorm_id or ""}, old_key=old_key)
+        self.assigned.pop(old_key, None)
+        self.assigned[student_id] = dorm_id or ""
+        self.version = data_version("dorms", "allocations")
+
+    def _best_dorm(self, s):
+        """Best-scoring dorm with a free bed (ties go to the earlier dorm), or None"""
+        if not s.valid:
+            return None
+        best, best_score = None, None
+        try:
+            for d in self.dorms:
+                if self.used[d.dorm_id] < self.capacity[d.dorm_id]:
+                    score = compatibility_score(s, d)
+                    if best is None or score > best_score:
+                        best, best_score = d.dorm_id, score
+        except ValueError:
+            log_event("WARN", f"Student {s.student_id} has a non-numeric year or priority; left unplaced")
+            return None
+        return best
+
+    def free_beds(self, dorm_id):
+        with table_lock("allocations"):
+            self._sync()
+            return self.capacity.get(dorm_id, 0) - self.used.get(dorm_id, 0)
+
+    def dorm_of(self, student_id):
+        with table_lock("allocations"):
+            self._sync()
+            return self.assigned.get(student_id) or None
+
+    def place(self, student):
+        """Give a student their best dorm with room left; returns it or None.
+
+        A student who already has a bed keeps it. Invalid IDs are never
+        placed, as in every allocation strategy.
+        """
+        s = _student(student)
+        with table_lock("allocations"):
+            self._sync()
+            current = self.assigned.get(s.student_id)
+            if current or not s.valid:
+                return current or None
+            dorm_id = self._best_dorm(s)
+            self._take(dorm_id, 1)
+            self._write(s.student_id, dorm_id)
+            if dorm_id is None:
+                waitlist.add(s)
+            return dorm_id
+
+    def place_many(self, students):
+        """place() for many students, written in one batch; {student_id: dorm_id or None}"""
+        placed, rows, waiting = {}, [], []
+        with table_lock("allocations"):
+            self._sync()
+            for student in students:
+                s = _student(student)
+                if self.assigned.get(s.student_id) or not s.valid or s.student_id in placed:
+                    continue
+                dorm_id = placed[s.student_id] = self._best_dorm(s)
+                self._take(dorm_id, 1)
+                self.assigned[s.student_id] = dorm_id or ""
+                rows.append({"student_id": s.student_id, "dorm_id": dorm_id or ""})
+                if dorm_id is None:
+                    waiting.append(s)
+            if rows:
+                apply_rows("allocations", rows)
+                self.version = data_version("dorms", "allocations")
+            waitlist.add_many(waiting)
+        return placed
+
+    def fill(self, dorm_id):
+        """Give dorm_id's free beds to the waitlist; returns the students placed"""
+        placed = []
+        with table_lock("allocations"):
+            self._sync()
+            while dorm_id in self.capacity and self.used[dorm_id] < self.capacity[dorm_id]:
+                student_id = waitlist.pop_for(dorm_id)
+                if student_id is None:
+                    break
+                self._take(dorm_id, 1)
+                self._write(student_id, dorm_id)
+                placed.append(student_id)
+        return placed
+
+    def fill_all(self):
+        """Fill every free bed from the waitlist; {student_id: dorm_id} placed"""
+        with table_lock("allocations"):
+            self._sync()
+            return {sid: dorm_id for dorm_id in list(self.capacity) for sid in self.fill(dorm_id)}
+
+    def total_free(self):
+        with table_lock("allocations"):
+            self._sync()
+            return sum(max(0, self.capacity[d] - self.used[d]) for d in self.capacity)
+
+    def free(self, student_id):
+        """Drop a student's allocation row and hand their bed to the waitlist.
+
+        Returns the dorm whose bed was freed.
+        """
+        with table_lock("allocations"):
+            self._sync()
+            waitlist.remove(student_id)
+            if student_id not in self.assigned:
+                return None
+            dorm_id = self.assigned.pop(student_id)
+            self._take(dorm_id, -1)
+            delete_row("allocations", student_id)
+            self.version = data_version("dorms", "allocations")
+            self.fill(dorm_id)
+            return dorm_id or None
+
+    def free_many(self, student_ids):
+        """free() for many students, written in one batch; returns the dorms whose beds were freed"""
+        with table_lock("allocations"):
+            self._sync()
+            waitlist.remove_many(student_ids)
+            gone = [sid for sid in dict.fromkeys(student_ids) if sid in self.assigned]
+            freed = []
+            for sid in gone:
+                dorm_id = self.assigned.pop(sid)
+                self._take(dorm_id, -1)
+                if dorm_id and dorm_id not in freed:
+                    freed.append(dorm_id)
+            if gone:
+                apply_rows("allocations", [], gone)
+                self.version = data_version("dorms", "allocations")
+            for dorm_id in freed:
+                self.fill(dorm_id)
+            return freed
+
+    def update(self, old, new):
+        """Follow a student edit from row old to row new; returns their dorm.
+
+        A changed ID carries the allocation row over. The student is only
+        re-placed when a field that affects their scores changed (or they
+        had no bed yet), so renaming someone never moves them.
+        """
+        old_id, s = old["student_id"], _student(new)
+        with table_lock("allocations"):
+            self._sync()
+            if not s.valid:
+                self.free(old_id)
+                return None
+            arrival = waitlist.remove(old_id)
+            current = self.assigned.get(old_id) or None
+            if current is None or any(old.get(f) != new.get(f) for f in PLACEMENT_FIELDS):
+                # Give up the current bed first so the student may keep it
+                self._take(current, -1)
+                dorm_id = self._best_dorm(s)
+                self._take(current, 1)
+            else:
+                dorm_id = current
+            if dorm_id is None:
+                # Still waiting: keep their place in line
+                waitlist.add(s, arrival)
+            if dorm_id == current and s.student_id == old_id and old_id in self.assigned:
+                return dorm_id
+            self._take(current, -1)
+            self._take(dorm_id, 1)
+            self._write(s.student_id, dorm_id, old_key=old_id)
+            if current != dorm_id:
+                self.fill(current)
+            return dorm_id
+
+    def move(self, student_id, dorm_id):
+        """Move a student into dorm_id; ValueError if it is unknown or full"""
+        with table_lock("allocations"):
+            self._sync()
+            if dorm_id not in self.capacity:
+                raise ValueError(f"Dorm {dorm_id} does not exist")
+            current = self.assigned.get(student_id) or None
+            if current == dorm_id:
+                return
+            if self.used[dorm_id] >= self.capacity[dorm_id]:
+                raise ValueError(f"Dorm {dorm_id} has no free bed")
+            self._take(current, -1)
+            self._take(dorm_id, 1)
+            self._write(student_id, dorm_id)
+            waitlist.remove(student_id)
+            self.fill(current)
+
+occupancy = Occupancy()
+
+@on_change
+def _follow_students(table, changes):
+    # Students added or dropped in bulk (an import) get or give up beds here;
+    # the single-student routes go through place/update themselves
+    if table != "students":
+        return
+    if changes["full"]:
+        present = {r["student_id"] for r in students_snapshot()}
+        with table_lock("allocations"):
+            occupancy._sync()
+            stale = [sid for sid in occupancy.assigned if sid not in present]
+        occupancy.free_many(stale)
+    if changes["deleted"]:
+        occupancy.free_many(changes["deleted"])
+    if changes["inserted"]:
+        inserted = changes["inserted"]
+        occupancy.place_many([r for r in students_snapshot() if r["student_id"] in inserted])
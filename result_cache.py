@@ -0,0 +1,139 @@
+# result_cache.py - LRU cache of computed results, keyed by the tables they were computed from
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from storage import on_change, table_etag
+
+MAX_ENTRIES = 128
+MAX_BYTES = 64 * 1024 * 1024         # pickled size of everything held in memory
+DISK_MAX_BYTES = 256 * 1024 * 1024
+
+class ResultCache:
+    """Results of expensive views, keyed by kind, input tables and parameters.
+
+    A key hashes the table_etag of every table the result was computed
+    from together with its parameters, so a write to any of those tables
+    makes the old entry unreachable, and in every worker process too.
+    Writes seen in this process also drop the entries at once (see
+    _drop_on_write). Memory holds at most max_entries results and
+    max_bytes of their pickled size, least recently used out first.
+    With disk_dir set, results are also written there as one pickle per
+    key, shared by all workers and trimmed oldest first to
+    disk_max_bytes. Cached values are shared: do not mutate them.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, disk_dir=None,
+                 disk_max_bytes=DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()  # key -> (tables, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind, tables, params):
+        parts = [kind] + [f"{t}={table_etag(t)}" for t in tables] + [f"{k}={params[k]!r}" for k in sorted(params)]
+        return hashlib.blake2b("\n".join(parts).encode(), digest_size=16).hexdigest()
+
+    def get_or_compute(self, kind, tables, compute, **params):
+        """Cached result of compute() for these tables and params, computing it on a miss"""
+        key = self.key(kind, tables, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+        data = self._read_disk(key)
+        on_disk = data is not None
+        if on_disk:
+            value = pickle.loads(data)
+        else:
+            value = compute()
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self._write_disk(key, data)
+        with self._lock:
+            if on_disk:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._store(key, tuple(tables), len(data), value)
+        return value
+
+    def _store(self, key, tables, size, value):
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (tables, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, dropped, _) = self._entries.popitem(last=False)
+            self._bytes -= dropped
+
+    def invalidate(self, table=None):
+        """Drop in-memory results computed from table (everything when None)"""
+        with self._lock:
+            for key in [k for k, (tables, _, _) in self._entries.items() if table is None or table in tables]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+    # ------------- Disk tier -------------
+    def _path(self, key):
+        return self.disk_dir / f"{key}.pkl"
+
+    def _read_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        try:
+            data = self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(self._path(key))  # recently used: trimmed last
+        return data
+
+    def _write_disk(self, key, data):
+        if self.disk_dir is None or len(data) > self.disk_max_bytes:
+            return
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.disk_dir, prefix=f".{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_name, self._path(key))
+        finally:
+            Path(tmp_name).unlink(missing_ok=True)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for path in self.disk_dir.glob("*.pkl"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime_ns, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+results = ResultCache(disk_dir=os.environ.get("SMARTDORM_CACHE_DIR"))
+
+@on_change
+def _drop_on_write(table, changes):
+    results.invalidate(table)
@@ -0,0 +1,130 @@
+# scoring.py - batched student x dorm compatibility scores with NumPy
+import numpy as np
+
+from models import parse_attrs
+from snapshot import build_columns, INVALID_INT, FLAG_QUIET, FLAG_STUDIOUS
+from storage import current_roster_snapshot
+
+# Dorm attribute bits, lined up with the student score_flags they reward
+ATTR_QUIET = FLAG_QUIET
+ATTR_NEAR_LIBRARY = FLAG_STUDIOUS
+
+def dorm_attr_mask(dorm):
+    attrs = parse_attrs(dorm.get("attributes", ""))
+    return (ATTR_QUIET if "quiet" in attrs else 0) | (ATTR_NEAR_LIBRARY if "near_library" in attrs else 0)
+
+class ScoreMatrix:
+    """compatibility_score for every (student, dorm) pair, computed in one pass.
+
+    matrix[i, j] equals compatibility_score(students[i], dorms[j]) (scores are
+    whole numbers, so they are kept as int32). Rows follow the order of the
+    students the matrix was built from, columns the order of dorms.
+    """
+
+    def __init__(self, matrix, student_ids, dorm_ids, valid):
+        self.matrix = matrix
+        self.student_ids = student_ids
+        self.dorm_ids = dorm_ids
+        self.valid = valid
+        self._ranking = None
+        self._rank_order = None
+
+    @classmethod
+    def build(cls, students, dorms):
+        # Only the scored columns: free-text tags never reach the matrix
+        built = build_columns(students, text=False)
+        cols = built["columns"]
+        student_ids = [s["student_id"] for s in students]
+        return cls._from_columns(cols, built["dorm_ids"], student_ids, dorms)
+
+    @classmethod
+    def current(cls, students, dorms):
+        """Scores for the live students, read from the roster snapshot when it is up to date.
+
+        The snapshot's columns are already encoded, so this skips parsing
+        every row; build() is the fallback while the snapshot is rebuilt.
+        """
+        roster = current_roster_snapshot()
+        if roster is not None and len(roster) == len(students):
+            scores = cls.from_roster(roster, dorms)
+            if scores.student_ids == [s["student_id"] for s in students]:
+                return scores
+        return cls.build(students, dorms)
+
+    @classmethod
+    def from_roster(cls, roster, dorms):
+        """Score straight from a memory-mapped RosterSnapshot, no CSV parsing"""
+        cols = {name: getattr(roster, name) for name in
+                ("year", "priority", "valid", "score_flags", "pref_offsets", "pref_dorms")}
+        student_ids = [roster.student_id(i) for i in range(len(roster))]
+        return cls._from_columns(cols, roster.dorm_ids, student_ids, dorms)
+
+    @classmethod
+    def _from_columns(cls, cols, pref_dorm_ids, student_ids, dorms):
+        n, d = len(student_ids), len(dorms)
+        year = np.asarray(cols["year"], dtype=np.int64)
+        priority = np.asarray(cols["priority"], dtype=np.int64)
+        valid = np.asarray(cols["valid"], dtype=bool)
+        bad = (year == INVALID_INT) | (priority == INVALID_INT)
+        # Allocation skips invalid ids before scoring them, so only valid rows must parse
+        if (bad & valid).any():
+            sid = student_ids[np.flatnonzero(bad & valid)[0]]
+            raise ValueError(f"Student {sid} has a non-numeric year or priority")
+        year = np.where(bad, 0, year)
+        priority = np.where(bad, 0, priority)
+
+        # Per-student part: priority and year don't depend on the dorm
+        base = 3 * priority + np.maximum(0, 5 - np.abs(year - 2))
+        matrix = np.repeat(base.astype(np.int32)[:, None], d, axis=1)
+
+        # Tag/attribute bonuses: +2 for each matching bit
+        flags = np.asarray(cols["score_flags"], dtype=np.uint8)
+        attrs = np.array([dorm_attr_mask(dm) for dm in dorms], dtype=np.uint8)
+        both = flags[:, None] & attrs[None, :]
+        matrix += 2 * ((both & 1) + ((both >> 1) & 1)).astype(np.int32)
+
+        # Preference ranks: 10 - 2*rank where rank is the position in the full list
+        offsets = np.asarray(cols["pref_offsets"], dtype=np.int64)
+        pref_dorms = np.asarray(cols["pref_dorms"], dtype=np.int64)
+        if pref_dorms.size:
+            column_of = {did: j for j, did in reversed(list(enumerate(dm["dorm_id"] for dm in dorms)))}
+            pref_col = np.array([column_of.get(did, -1) for did in pref_dorm_ids], dtype=np.int64)[pref_dorms]
+            owner = np.repeat(np.arange(n), np.diff(offsets))
+            rank = np.arange(pref_dorms.size) - offsets[owner]
+            bonus = 10 - 2 * rank
+            keep = (bonus > 0) & (pref_col >= 0)
+            pref = np.zeros((n, d), dtype=np.int32)
+            # A dorm listed twice counts at its first (best) rank
+            np.maximum.at(pref, (owner[keep], pref_col[keep]), bonus[keep].astype(np.int32))
+            # Every column with the same dorm id gets the bonus, as in compatibility_score
+            dorm_cols = np.array([column_of[dm["dorm_id"]] for dm in dorms], dtype=np.int64)
+            matrix += pref[:, dorm_cols]
+
+        return cls(matrix, student_ids, [dm["dorm_id"] for dm in dorms], valid)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def score(self, i, j):
+        return float(self.matrix[i, j])
+
+    def ranked_dorms(self, i):
+        """Dorm columns for student i, best first (ties keep dorm order)"""
+        return np.argsort(-self.matrix[i], kind="stable")
+
+    def ranking(self):
+        """ranked_dorms for every student, sorted once and kept.
+
+        Rows are memoryviews, which the greedy engines index and iterate as
+        plain ints without converting the whole table to Python lists.
+        """
+        if self._ranking is None:
+            self._ranking = [memoryview(row) for row in self.rank_order()]
+        return self._ranking
+
+    def rank_order(self):
+        """The same ranking as one (students x dorms) array of dorm columns"""
+        if self._rank_order is None:
+            dtype = np.int16 if len(self.dorm_ids) < 2 ** 15 else np.int32
+            self._rank_order = np.argsort(-self.matrix, axis=1, kind="stable").astype(dtype)
+        return self._rank_order
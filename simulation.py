@@ -0,0 +1,326 @@
+# simulation.py - parallel Monte Carlo over random greedy orderings
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models import as_students, as_dorms
+from scoring import ScoreMatrix
+
+MAX_TRIALS = 10000
+TRIALS_PER_TASK = 32     # trials run together as one batch / pool task
+BLOCK_STEPS = 256        # steps per trial settled together in run_batch
+MIN_TRIALS = 30          # never stop early before this many trials
+POOL_MIN_WORK = 200_000  # students x trials below which a pool costs more than it saves
+Z_95 = 1.959963984540054
+METRICS = ["top1", "top3", "envy_pairs"]
+
+# ------------- Encoded roster -------------
+class EncodedRoster:
+    """Everything a trial needs, as flat arrays.
+
+    Dorm rows sharing an id share one slot of beds, like greedy_allocation's
+    capacities dict; students sharing an id share one "group" because the
+    metrics look allocations up by id. ranking holds each student's slots,
+    best first, in place of ScoreMatrix's dorm columns; pref_* list each
+    student's distinct preferences that name a real dorm, with their rank.
+    """
+
+    def __init__(self, arrays, total):
+        self.arrays = arrays
+        self.total = total
+        for name, arr in arrays.items():
+            setattr(self, name, arr)
+        self.n_slots = len(self.capacity)
+        self.n_groups = int(self.group.max()) + 1 if len(self.group) else 0
+        # Whether two valid rows share an id (then the later visit decides)
+        self.repeats = len(np.unique(self.group[self.valid])) < np.count_nonzero(self.valid)
+
+    @classmethod
+    def build(cls, students, dorms, scores=None):
+        students, dorms = as_students(students), as_dorms(dorms)
+        if scores is None:
+            scores = ScoreMatrix.build(students, dorms)
+
+        capacities = {d.dorm_id: d.capacity for d in dorms}
+        slot_of = {dorm_id: n for n, dorm_id in enumerate(capacities)}
+        groups = {}
+        pref_student, pref_slot, pref_rank = [], [], []
+        for i, s in enumerate(students):
+            groups.setdefault(s.student_id, len(groups))
+            for dorm_id, rank in s.rank.items():
+                if dorm_id in slot_of:
+                    pref_student.append(i)
+                    pref_slot.append(slot_of[dorm_id])
+                    pref_rank.append(rank)
+
+        order = scores.rank_order()
+        slot_of_col = np.array([slot_of[d.dorm_id] for d in dorms], dtype=order.dtype)
+        arrays = {
+            "ranking": slot_of_col[order],
+            "capacity": np.array(list(capacities.values()), dtype=np.int64),
+            "valid": np.array([s.valid for s in students], dtype=bool),
+            "group": np.array([groups[s.student_id] for s in students], dtype=np.int32),
+            "pref_student": np.array(pref_student, dtype=np.int32),
+            "pref_slot": np.array(pref_slot, dtype=np.int32),
+            "pref_rank": np.array(pref_rank, dtype=np.int32),
+        }
+        return cls(arrays, len(students))
+
+    def to_shared(self):
+        """Copy the arrays into one shared-memory block; returns (block, layout)"""
+        layout, offset = [], 0
+        for name, arr in self.arrays.items():
+            offset += -offset % 8
+            layout.append((name, arr.dtype.str, arr.shape, offset))
+            offset += arr.nbytes
+        block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (name, dtype, shape, start), arr in zip(layout, self.arrays.values()):
+            np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)[...] = arr
+        return block, layout
+
+    @classmethod
+    def from_shared(cls, block, layout, total):
+        arrays = {name: np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)
+                  for name, dtype, shape, start in layout}
+        return cls(arrays, total)
+
+# ------------- Trials -------------
+def trial_stream(seed, trial):
+    """Independent RNG for one trial, the same whichever worker runs it"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(trial,)))
+
+def trial_orders(enc, seed, first, count):
+    """(count, valid students) array of visiting orders, one row per trial.
+
+    Each row is trial t's permutation with invalid students dropped, exactly
+    what a one-trial-at-a-time loop over rng.permutation would visit.
+    """
+    n = len(enc.valid)
+    perms = np.stack([trial_stream(seed, t).permutation(n) for t in range(first, first + count)])
+    keep = enc.valid[perms]
+    return perms[keep].reshape(count, -1) if n else perms
+
+def _first_free(enc, left, students, offset, start):
+    """First place at or after start in each student's ranking whose dorm
+    still has a bed in left. Returns (bins, places); students with nothing
+    left get the "no bed" bin and place = number of dorms.
+
+    Looks one place ahead first, then in ever wider windows: most students
+    stop within a few places.
+    """
+    depth = enc.ranking.shape[1]
+    flat = enc.ranking.ravel()
+    bins = np.full(len(students), len(left) - 1, dtype=np.int64)
+    places = np.full(len(students), depth, dtype=np.int64)
+    k = np.flatnonzero(start < depth)
+    start = start.copy()
+    width = 1
+    while len(k):
+        cols = start[k, None] + np.arange(width)
+        inside = cols < depth
+        rows = flat[students[k, None] * depth + np.minimum(cols, depth - 1)] + offset[k, None]
+        free = (left[rows] > 0) & inside
+        pick = free.argmax(axis=1)
+        got = free[np.arange(len(k)), pick]
+        bins[k[got]] = rows[got, pick[got]]
+        places[k[got]] = cols[got, pick[got]]
+        start[k] += width
+        k = k[~got & (start[k] < depth)]
+        width *= 4
+    return bins, places
+
+def _has_beds(left, K, n):
+    return (left[:K * n].reshape(K, n) > 0).any(axis=1)
+
+def run_batch(enc, orders):
+    """Greedy allocation for every row of orders at once.
+
+    Trial k's beds sit at k*n_slots onwards in one flat beds-left array,
+    with a last bin that never fills standing for "no bed". Students are
+    taken a block of steps at a time: each gets, as a tentative choice, the
+    first dorm in their ranking that still has a bed. Tentative choices are
+    exactly what greedy would do up to the first student whose dorm has
+    already been filled by earlier students of the block, so every trial
+    accepts its block up to that point in one go; students whose dorm is now
+    full walk on down their ranking, and the block repeats until done.
+    Returns each trial's slot per id group, -1 where nobody got a bed.
+    """
+    K, steps = orders.shape
+    n = enc.n_slots
+    depth = enc.ranking.shape[1]
+    nowhere = K * n
+    left = np.append(np.tile(enc.capacity, K), orders.size + 1)
+    offset = np.arange(K, dtype=np.int64) * n
+    students = orders.T
+    chosen = np.empty((steps, K), dtype=np.int64)
+    for b in range(0, steps, BLOCK_STEPS):
+        block = students[b:b + BLOCK_STEPS]
+        size = len(block)
+        step = np.repeat(np.arange(size), K)
+        trial = np.tile(np.arange(K), size)
+        # Trials that have no bed left anywhere skip the walk: nobody gets one
+        start = np.where(_has_beds(left, K, n), 0, depth)
+        bins, places = _first_free(enc, left, block.ravel(), offset[trial], start[trial])
+        todo = np.arange(block.size)  # not yet accepted, in step order
+        while len(todo):
+            counts = np.bincount(bins[todo], minlength=len(left))
+            over = counts > left
+            if not over[bins[todo]].any():
+                left -= counts
+                break
+            # Within each oversubscribed bin, who is past its remaining beds
+            clash = todo[over[bins[todo]]]
+            by_bin = clash[np.argsort(bins[clash], kind="stable")]
+            sorted_bins = bins[by_bin]
+            starts = np.flatnonzero(np.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+            rank = np.arange(len(by_bin)) - np.repeat(starts, np.diff(np.r_[starts, len(by_bin)]))
+            late = by_bin[rank >= left[sorted_bins]]
+            stop = np.full(K, size)
+            np.minimum.at(stop, trial[late], step[late])
+
+            accept = step[todo] < stop[trial[todo]]
+            left -= np.bincount(bins[todo[accept]], minlength=len(left))
+            todo = todo[~accept]
+            redo = todo[left[bins[todo]] <= 0]
+            start = np.where(_has_beds(left, K, n)[trial[redo]], places[redo] + 1, depth)
+            bins[redo], places[redo] = _first_free(enc, left, block.ravel()[redo], offset[trial[redo]], start)
+        chosen[b:b + size] = bins.reshape(size, K)
+    placed = np.where(chosen == nowhere, -1, chosen - offset).T
+
+    # Scatter to id groups; when an id repeats, the last of its rows visited wins
+    final = np.full((K, enc.n_groups), -1, dtype=np.int64)
+    groups = enc.group[orders]
+    if not enc.repeats:
+        final[np.arange(K)[:, None], groups] = placed
+    else:
+        flat = (groups + np.arange(K)[:, None] * enc.n_groups).ravel()[::-1]
+        _, last = np.unique(flat, return_index=True)
+        final.ravel()[flat[last]] = placed.ravel()[::-1][last]
+    return final
+
+def batch_metrics(enc, final):
+    """(top1_rate, top3_rate, envy_pairs) per trial for run_batch's output"""
+    K = len(final)
+    if not enc.total:
+        return [(0.0, 0.0, 0)] * K
+    assigned = final[:, enc.group]
+    hit = assigned[:, enc.pref_student] == enc.pref_slot[None, :]
+    top1 = np.count_nonzero(hit & (enc.pref_rank == 0), axis=1)
+    top3 = np.count_nonzero(hit & (enc.pref_rank < 3), axis=1)
+    # Same per-dorm envy sum as models.FairnessMetrics, all trials in one
+    # bincount by giving trial k the bins k*n_slots .. (k+1)*n_slots-1
+    n = enc.n_slots
+    base = np.arange(K)[:, None] * n
+    occupants = np.bincount((assigned + base)[assigned >= 0], minlength=K * n).reshape(K, n)
+    wanting = np.bincount(enc.pref_slot, minlength=n)
+    placed = np.bincount((enc.pref_slot[None, :] + base)[hit], minlength=K * n).reshape(K, n)
+    envy = (occupants * (wanting[None, :] - placed)).sum(axis=1)
+    return [(a / enc.total, b / enc.total, int(e)) for a, b, e in zip(top1.tolist(), top3.tolist(), envy.tolist())]
+
+def run_trials(enc, seed, first, count):
+    return batch_metrics(enc, run_batch(enc, trial_orders(enc, seed, first, count)))
+
+# Worker processes attach to the parent's shared block once, in the initializer
+_worker = {}
+
+def _attach(name, layout, total):
+    block = shared_memory.SharedMemory(name=name)
+    _worker["block"] = block
+    _worker["enc"] = EncodedRoster.from_shared(block, layout, total)
+
+def _worker_trials(seed, first, count):
+    return run_trials(_worker["enc"], seed, first, count)
+
+# ------------- Driver -------------
+class _Running:
+    """Running mean/variance per metric (Welford)"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = [0.0] * len(METRICS)
+        self.m2 = [0.0] * len(METRICS)
+
+    def add(self, values):
+        self.n += 1
+        for k, x in enumerate(values):
+            delta = x - self.mean[k]
+            self.mean[k] += delta / self.n
+            self.m2[k] += delta * (x - self.mean[k])
+
+    def half_width(self, k):
+        if self.n < 2:
+            return math.inf
+        return Z_95 * math.sqrt(self.m2[k] / (self.n - 1) / self.n)
+
+    def tight(self, precision):
+        return all(self.half_width(k) <= precision * abs(self.mean[k]) for k in range(len(METRICS)))
+
+def run_simulation(students, dorms, trials=100, seed=None, precision=None, workers=None, scores=None):
+    """Monte Carlo over `trials` shuffled greedy allocations.
+
+    Trial t always draws its order from SeedSequence(seed, spawn_key=(t,)),
+    so a seed reproduces the same numbers whatever the worker count. With
+    precision set (e.g. 0.01), stops once every metric's 95% confidence
+    interval is within +/- that fraction of its mean; results are consumed
+    in trial order, so where it stops is reproducible too. Runs under
+    POOL_MIN_WORK students x trials stay in this process.
+    """
+    trials = max(1, min(int(trials), MAX_TRIALS))
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2 ** 63)
+    enc = EncodedRoster.build(students, dorms, scores)
+    tasks = [(first, min(TRIALS_PER_TASK, trials - first)) for first in range(0, trials, TRIALS_PER_TASK)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers > 1 and len(students) * trials < POOL_MIN_WORK:
+        workers = 1
+
+    stats = _Running()
+    stopped_early = False
+
+    def consume(results):
+        for values in results:
+            stats.add(values)
+        return precision is not None and stats.n >= MIN_TRIALS and stats.tight(precision)
+
+    if workers == 1:
+        for first, count in tasks:
+            if consume(run_trials(enc, seed, first, count)):
+                stopped_early = stats.n < trials
+                break
+    else:
+        block, layout = enc.to_shared()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                     initargs=(block.name, layout, enc.total)) as pool:
+                pending = iter(tasks)
+                window = [pool.submit(_worker_trials, seed, *task) for _, task in zip(range(2 * workers), pending)]
+                while window:
+                    done = window.pop(0).result()
+                    if consume(done):
+                        stopped_early = stats.n < trials
+                        for f in window:
+                            f.cancel()
+                        break
+                    task = next(pending, None)
+                    if task is not None:
+                        window.append(pool.submit(_worker_trials, seed, *task))
+        finally:
+            block.close()
+            block.unlink()
+
+    result = {
+        "trials": stats.n,
+        "requested": trials,
+        "seed": seed,
+        "workers": workers,
+        "stopped_early": stopped_early,
+    }
+    for k, name in enumerate(METRICS):
+        half = stats.half_width(k)
+        mean = stats.mean[k]
+        result[f"avg_{name}"] = mean
+        result[f"ci_{name}"] = (mean - half, mean + half) if math.isfinite(half) else None
+    return result
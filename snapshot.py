@@ -0,0 +1,209 @@
+# snapshot.py - compact, memory-mapped binary form of the student roster
+import json
+import mmap
+import sys
+from array import array
+
+from utils import valid_student_id
+
+MAGIC = b"SDRS"
+FORMAT_VERSION = 2
+INVALID_INT = -2 ** 31  # year/priority that does not parse as an int
+
+# score_flags bits: substring checks compatibility_score does on the raw tags
+FLAG_QUIET = 1
+FLAG_STUDIOUS = 2
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return INVALID_INT
+
+def tag_tokens(tags):
+    """Tags split the way roommate_compatibility does (lower-cased, not stripped)"""
+    return set(str(tags).lower().split(",")) - {''}
+
+class _Strings:
+    """Variable-length strings as one UTF-8 blob plus an offsets array"""
+    def __init__(self):
+        self.offsets = array("I", [0])
+        self.blob = bytearray()
+
+    def add(self, text):
+        self.blob += text.encode("utf-8")
+        self.offsets.append(len(self.blob))
+
+def build_columns(students, text=True):
+    """Encode student rows into the snapshot's columns.
+
+    Dorm ids and tags are interned: preferences become indices into
+    dorm_ids (kept in full, in order), tags a bitmask over the tag list,
+    tag_words 64-bit words per student so any number of tags fits.
+    text=False builds only the columns scoring reads, without ids, names
+    or tags.
+    """
+    dorm_index, tag_index = {}, {}
+    year, priority = array("i"), array("i")
+    valid, score_flags = array("B"), array("B")
+    masks = []
+    pref_offsets, pref_dorms = array("I", [0]), array("I")
+    ids, names, raw_tags = _Strings(), _Strings(), _Strings()
+
+    for s in students:
+        sid = s.get("student_id", "")
+        tags = s.get("tags", "")
+        year.append(_to_int(s.get("year", 1)))
+        priority.append(_to_int(s.get("priority", 0)))
+        valid.append(valid_student_id(sid))
+        score_flags.append((FLAG_QUIET if "quiet" in tags else 0) |
+                           (FLAG_STUDIOUS if "studious" in tags else 0))
+
+        for p in s.get("preferred_dorms", "").split(","):
+            p = p.strip()
+            if p:
+                pref_dorms.append(dorm_index.setdefault(p, len(dorm_index)))
+        pref_offsets.append(len(pref_dorms))
+
+        if text:
+            ids.add(sid)
+            names.add(s.get("name", ""))
+            raw_tags.add(tags)
+            mask = 0
+            for tag in tag_tokens(tags):
+                mask |= 1 << tag_index.setdefault(tag, len(tag_index))
+            masks.append(mask)
+
+    columns = {
+        "year": year, "priority": priority, "valid": valid,
+        "score_flags": score_flags,
+        "pref_offsets": pref_offsets, "pref_dorms": pref_dorms,
+    }
+    if not text:
+        return {"dorm_ids": list(dorm_index), "columns": columns}
+
+    tag_words = max(1, -(-len(tag_index) // 64))
+    tag_mask = array("Q")
+    for mask in masks:
+        tag_mask.extend((mask >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for w in range(tag_words))
+    columns.update({
+        "tag_mask": tag_mask,
+        "id_offsets": ids.offsets, "id_blob": array("B", ids.blob),
+        "name_offsets": names.offsets, "name_blob": array("B", names.blob),
+        "tags_offsets": raw_tags.offsets, "tags_blob": array("B", raw_tags.blob),
+    })
+    return {"dorm_ids": list(dorm_index), "tags": list(tag_index), "tag_words": tag_words, "columns": columns}
+
+def write_snapshot(f, students, source=""):
+    """Write the roster to a binary file object.
+
+    Layout: MAGIC, u32 header length, JSON header, then each column as a
+    raw native-endian array, 8-byte aligned so it can be cast in place.
+    """
+    built = build_columns(students)
+    columns = built["columns"]
+    header = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "count": len(columns["year"]),
+        "source": source,
+        "dorm_ids": built["dorm_ids"],
+        "tags": built["tags"],
+        "tag_words": built["tag_words"],
+        "columns": {},
+    }
+    # Column offsets depend on the header size, so size it with placeholders first
+    for name, col in columns.items():
+        header["columns"][name] = [0, col.typecode, len(col)]
+    probe = json.dumps(header).encode("utf-8")
+    start = len(MAGIC) + 4 + len(probe) + 64 * len(columns)
+    start += -start % 8
+
+    offset = start
+    for name, col in columns.items():
+        header["columns"][name][0] = offset
+        offset += len(col) * col.itemsize
+        offset += -offset % 8
+    head = json.dumps(header).encode("utf-8")
+    head += b" " * (start - len(MAGIC) - 4 - len(head))
+
+    f.write(MAGIC)
+    f.write(len(head).to_bytes(4, "little"))
+    f.write(head)
+    for name, col in columns.items():
+        data = col.tobytes()
+        f.write(data)
+        f.write(b"\0" * (-len(data) % 8))
+
+class RosterSnapshot:
+    """Read-only, memory-mapped roster; columns are memoryviews over the file.
+
+    Processes that map the same file share its pages, and nothing is parsed
+    beyond the small JSON header.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != MAGIC:
+            raise ValueError(f"{path} is not a roster snapshot")
+        head_len = int.from_bytes(self._mm[4:8], "little")
+        header = json.loads(self._mm[8:8 + head_len])
+        if header["version"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written by an incompatible snapshot format")
+
+        self.path = path
+        self.source = header["source"]
+        self.count = header["count"]
+        self.dorm_ids = header["dorm_ids"]
+        self.tags = header["tags"]
+        self.tag_words = header["tag_words"]
+        view = memoryview(self._mm)
+        for name, (offset, typecode, length) in header["columns"].items():
+            nbytes = length * array(typecode).itemsize
+            setattr(self, name, view[offset:offset + nbytes].cast(typecode))
+
+    def __len__(self):
+        return self.count
+
+    def _string(self, offsets, blob, i):
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def student_id(self, i):
+        return self._string(self.id_offsets, self.id_blob, i)
+
+    def name(self, i):
+        return self._string(self.name_offsets, self.name_blob, i)
+
+    def raw_tags(self, i):
+        return self._string(self.tags_offsets, self.tags_blob, i)
+
+    def tag_bits(self, i):
+        """Student i's tags as one int, bit k set for self.tags[k]"""
+        words = self.tag_mask[i * self.tag_words:(i + 1) * self.tag_words]
+        return sum(word << (64 * w) for w, word in enumerate(words))
+
+    def pref_indices(self, i):
+        return self.pref_dorms[self.pref_offsets[i]:self.pref_offsets[i + 1]]
+
+    def prefs(self, i):
+        """Preferred dorm ids in rank order"""
+        return tuple(self.dorm_ids[d] for d in self.pref_indices(i))
+
+    def row(self, i):
+        """Student i as a CSV-style dict (preferred_dorms comes back normalised)"""
+        year, priority = self.year[i], self.priority[i]
+        return {
+            "student_id": self.student_id(i),
+            "name": self.name(i),
+            "year": "" if year == INVALID_INT else str(year),
+            "priority": "" if priority == INVALID_INT else str(priority),
+            "preferred_dorms": ",".join(self.prefs(i)),
+            "tags": self.raw_tags(i),
+        }
+
+    def close(self):
+        for name in list(vars(self)):
+            if isinstance(getattr(self, name), memoryview):
+                getattr(self, name).release()
+        self._mm.close()
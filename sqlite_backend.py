@@ -0,0 +1,186 @@
+# sqlite_backend.py - SQLite storage behind the same load_*/save_* API as the CSV files
+import argparse
+import sqlite3
+import threading
+from pathlib import Path
+from types import MappingProxyType
+
+from storage import TABLES, DATA_DIR, read_table, file_lock, _delta_path
+
+# Extra lookups the app does besides the primary key
+INDEXES = {
+    "allocations": ["dorm_id"],
+    "room_requests": ["student_id"],
+    "roommates": ["dorm_id"],
+}
+
+class SqliteBackend:
+    """One indexed table per dataset, keyed on student_id / dorm_id / id.
+
+    Row order follows rowid, so it matches insertion order like the CSVs.
+    Every write bumps a per-table version in the same transaction, which is
+    what the row cache and data_version() key on.
+    """
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._create_schema()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (tbl TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        for table, spec in TABLES.items():
+            cols = ", ".join(
+                f"{f} TEXT PRIMARY KEY" if f == spec["key"] else f"{f} TEXT NOT NULL DEFAULT ''"
+                for f in spec["fields"]
+            )
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols})")
+            for col in INDEXES.get(table, []):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table} ({col})")
+            conn.execute("INSERT OR IGNORE INTO meta (tbl, version) VALUES (?, 0)", (table,))
+
+    def _bump(self, conn, table):
+        conn.execute("UPDATE meta SET version = version + 1 WHERE tbl = ?", (table,))
+
+    def _values(self, table, row):
+        spec = TABLES[table]
+        return [
+            str(row.get(f)) if row.get(f) is not None else spec["defaults"].get(f, '')
+            for f in spec["fields"]
+        ]
+
+    def _upsert_sql(self, table):
+        spec = TABLES[table]
+        fields = spec["fields"]
+        updates = ", ".join(f"{f} = excluded.{f}" for f in fields if f != spec["key"])
+        return (
+            f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))}) "
+            f"ON CONFLICT({spec['key']}) DO UPDATE SET {updates}"
+        )
+
+    def version(self, table):
+        row = self._conn().execute("SELECT version FROM meta WHERE tbl = ?", (table,)).fetchone()
+        return ("sqlite", str(self.path), row[0] if row else 0)
+
+    def stable_version(self, table):
+        return self.version(table)
+
+    def exists(self, table):
+        # Every write bumps the version; the schema alone starts at 0
+        return self.version(table)[2] > 0
+
+    def rows(self, table):
+        version = self.version(table)
+        with self._cache_lock:
+            hit = self._cache.get(table)
+            if hit is not None and hit[0] == version:
+                return hit[1]
+
+        fields = TABLES[table]["fields"]
+        cur = self._conn().execute(f"SELECT {', '.join(fields)} FROM {table} ORDER BY rowid")
+        snapshot = tuple(MappingProxyType(dict(zip(fields, r))) for r in cur)
+
+        with self._cache_lock:
+            if self.version(table) == version:
+                self._cache[table] = (version, snapshot)
+        return snapshot
+
+    def save(self, table, rows):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"DELETE FROM {table}")
+            conn.executemany(self._upsert_sql(table), (self._values(table, r) for r in rows))
+            self._bump(conn, table)
+
+    def upsert(self, table, row, old_key=None):
+        key = TABLES[table]["key"]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if old_key is not None and old_key != row[key]:
+                # Key change: rewrite the row in place so it keeps its position
+                fields = TABLES[table]["fields"]
+                sets = ", ".join(f"{f} = ?" for f in fields)
+                cur = conn.execute(f"UPDATE {table} SET {sets} WHERE {key} = ?",
+                                   self._values(table, row) + [old_key])
+                if cur.rowcount == 0:
+                    conn.execute(self._upsert_sql(table), self._values(table, row))
+            else:
+                conn.execute(self._upsert_sql(table), self._values(table, row))
+            self._bump(conn, table)
+
+    def delete(self, table, key_value):
+        key = TABLES[table]["key"]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(f"DELETE FROM {table} WHERE {key} = ?", (key_value,))
+            if cur.rowcount:
+                self._bump(conn, table)
+
+    def apply_changes(self, table, upserts, deletes):
+        """Upserts and deletes in one transaction"""
+        if not upserts and not deletes:
+            return
+        key = TABLES[table]["key"]
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(self._upsert_sql(table), (self._values(table, r) for r in upserts))
+            conn.executemany(f"DELETE FROM {table} WHERE {key} = ?", ((k,) for k in deletes))
+            self._bump(conn, table)
+
+    def lock(self, table):
+        # SQLite serialises single statements itself; this covers read-modify-write
+        return file_lock(self.path.with_name(f"{self.path.name}.{table}"))
+
+def migrate(db_path, data_dir=DATA_DIR):
+    """Import the data/*.csv files into a SQLite database; returns rows per table.
+
+    Edits still waiting in a <table>.delta.csv are applied on the way in;
+    tables without a CSV file are not created.
+    """
+    backend = SqliteBackend(db_path)
+    counts = {}
+    for table, spec in TABLES.items():
+        path = Path(data_dir) / spec["file"].name
+        if not path.exists() and not _delta_path(path).exists():
+            # Never written: left for the app to create, as with the CSV files
+            counts[table] = 0
+            continue
+        rows = read_table(table, path)
+        backend.save(table, rows)
+        counts[table] = len(backend.rows(table))
+    return backend, counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Smart Dorm SQLite storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("migrate", help="import data/*.csv into the SQLite database")
+    m.add_argument("--db", default=str(DATA_DIR / "smartdorm.db"))
+    m.add_argument("--data", default=str(DATA_DIR))
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        _, counts = migrate(args.db, args.data)
+        for table, n in counts.items():
+            print(f"{table}: {n} rows")
+        print(f"✅ Migrated into {args.db} - run the app with SMARTDORM_STORAGE=sqlite")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,36 @@
 # storage.py
 import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
+from types import MappingProxyType
+
+from utils import valid_student_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
 
 DATA_DIR = Path("data")
 STUDENTS_FILE = DATA_DIR / "students.csv"
 DORMS_FILE = DATA_DIR / "dorms.csv"
 ALLOC_FILE = DATA_DIR / "allocations.csv"
+MAINTENANCE_FILE = DATA_DIR / "maintenance.csv"
+ROOM_REQUESTS_FILE = DATA_DIR / "room_requests.csv"
+ROOMMATES_FILE = DATA_DIR / "roommates.csv"
+WAITLIST_FILE = DATA_DIR / "waitlist.csv"
 
 def read_csv(path):
-    if not path.exists():
-        return []
+    # Files are only ever replaced atomically, so anything other than a
+    # missing file is a real error and must not look like an empty dataset
     try:
         with path.open(newline="", encoding="utf-8") as f:
             reader = csv.DictReader(f)
@@ -19,55 +40,806 @@ def read_csv(path):
                 fixed_row = {k: (v if v is not None else '') for k, v in row.items()}
                 result.append(fixed_row)
             return result
-    except Exception:
+    except FileNotFoundError:
         return []
 
+# ------------- Locking & crash-safe writes -------------
+_lock_state = threading.local()
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock for writers of path, re-entrant within a thread.
+
+    Readers never take it: writers only ever rename complete files into place.
+    """
+    lock_path = path.with_name("." + path.name + ".lock")
+    key = str(lock_path)
+    held = getattr(_lock_state, "held", None)
+    if held is None:
+        held = _lock_state.held = {}
+    if key in held:
+        held[key] += 1
+        try:
+            yield
+        finally:
+            held[key] -= 1
+        return
+
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.Lock())
+    with thread_lock:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a") as fh:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            held[key] = 1
+            try:
+                yield
+            finally:
+                del held[key]
+                if fcntl:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+def _journal_path(path):
+    return path.with_name("." + path.name + ".journal")
+
+def _write_journal(path, entry):
+    with _journal_path(path).open("w", encoding="utf-8") as f:
+        json.dump(entry, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _fsync_dir(directory):
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def recover(path):
+    """Finish or roll back a write to path that was interrupted by a crash.
+
+    Call with the file's lock held. A "replace" entry is only journaled once
+    its temp file is fully synced, so it is rolled forward; an "append" is
+    rolled back to the size recorded before it started.
+    """
+    journal = _journal_path(path)
+    if journal.exists():
+        try:
+            entry = json.loads(journal.read_text(encoding="utf-8"))
+        except ValueError:
+            entry = {}  # torn journal: the write itself never started
+        if entry.get("op") == "replace":
+            tmp = path.with_name(entry["tmp"])
+            if tmp.exists():
+                os.replace(tmp, path)
+        elif entry.get("op") == "append" and path.exists():
+            if entry["size"] == 0:
+                path.unlink()
+            else:
+                with path.open("r+b") as f:
+                    f.truncate(entry["size"])
+        journal.unlink()
+    for tmp in path.parent.glob("." + path.name + ".*.tmp"):
+        tmp.unlink(missing_ok=True)
+    invalidate(path)
+
+def append_csv_rows(path, rows, header):
+    """Append rows to a CSV under its lock, writing the header for a new file"""
+    with file_lock(path):
+        size = path.stat().st_size if path.exists() else 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_journal(path, {"op": "append", "size": size})
+        with path.open("a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if size == 0:
+                writer.writerow(header)
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        _journal_path(path).unlink()
+    invalidate(path)
+
+# Parsed-dataset cache: path -> (signature, read-only rows)
+_cache = {}
+_cache_lock = threading.Lock()
+_versions = {}
+
+def file_signature(path):
+    """(local write counter, mtime_ns, size, inode) - changes whenever the file does.
+
+    Everything after the counter is the same in every process (atomic
+    replaces always give a new inode), see stable_version().
+    """
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return (_versions.get(str(path), 0), None, None, None)
+    return (_versions.get(str(path), 0), st.st_mtime_ns, st.st_size, st.st_ino)
+
+def invalidate(path=None):
+    """Drop cached rows for one file (or everything)"""
+    with _cache_lock:
+        if path is None:
+            _cache.clear()
+        else:
+            key = str(path)
+            _versions[key] = _versions.get(key, 0) + 1
+            _cache.pop(key, None)
+
+def read_csv_cached(path, normalize=None):
+    """Read-only snapshot of a CSV, re-parsed only when the file changes.
+
+    Rows are MappingProxyType views shared between callers, so treat them as
+    immutable; use read_csv/load_* when you need dicts you can edit.
+    """
+    key = str(path)
+    sig = file_signature(path)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None and hit[0] == sig:
+            return hit[1]
+
+    rows = read_csv(path)
+    if normalize:
+        for row in rows:
+            normalize(row)
+    snapshot = tuple(MappingProxyType(row) for row in rows)
+
+    with _cache_lock:
+        # Only publish if nobody wrote the file while we were parsing
+        if file_signature(path) == sig:
+            _cache[key] = (sig, snapshot)
+    return snapshot
+
 def write_csv(path, rows, fieldnames):
+    """Replace path atomically: temp file, fsync, journal, rename"""
     path.parent.mkdir(parents=True, exist_ok=True)
-    # Ensure all rows have all fieldnames with safe defaults
-    safe_rows = []
-    for row in rows:
-        safe_row = {k: (row.get(k, '') if row.get(k) is not None else '') for k in fieldnames}
-        safe_rows.append(safe_row)
-    
-    with path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(safe_rows)
+    with file_lock(path):
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix="." + path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                writer.writeheader()
+                for row in rows:
+                    # Ensure all rows have all fieldnames with safe defaults
+                    writer.writerow({k: (row.get(k, '') if row.get(k) is not None else '') for k in fieldnames})
+                f.flush()
+                os.fsync(f.fileno())
+            _write_journal(path, {"op": "replace", "tmp": Path(tmp_name).name})
+            os.replace(tmp_name, path)
+            _fsync_dir(path.parent)
+        finally:
+            Path(tmp_name).unlink(missing_ok=True)
+            _journal_path(path).unlink(missing_ok=True)
+    invalidate(path)
+
+# Every dataset the app keeps: csv file, columns, key column, defaults for missing columns
+TABLES = {
+    "students": {
+        "file": STUDENTS_FILE,
+        "fields": ["student_id", "name", "year", "priority", "preferred_dorms", "tags"],
+        "key": "student_id",
+        "defaults": {"year": "1", "priority": "0"},
+    },
+    "dorms": {
+        "file": DORMS_FILE,
+        "fields": ["dorm_id", "name", "capacity", "attributes"],
+        "key": "dorm_id",
+        "defaults": {},
+    },
+    "allocations": {
+        "file": ALLOC_FILE,
+        "fields": ["student_id", "dorm_id"],
+        "key": "student_id",
+        "defaults": {},
+    },
+    "tickets": {
+        "file": MAINTENANCE_FILE,
+        "fields": ["id", "room", "issue", "reported", "status", "resolved"],
+        "key": "id",
+        "defaults": {},
+    },
+    "room_requests": {
+        "file": ROOM_REQUESTS_FILE,
+        "fields": ["id", "student_id", "current_dorm", "new_dorm", "reason", "status", "timestamp"],
+        "key": "id",
+        "defaults": {},
+    },
+    "roommates": {
+        "file": ROOMMATES_FILE,
+        "fields": ["student_id", "roommate_id", "dorm_id", "score"],
+        "key": "student_id",
+        "defaults": {},
+    },
+    "waitlist": {
+        "file": WAITLIST_FILE,
+        "fields": ["student_id", "name", "priority", "preferred_dorms", "arrival"],
+        "key": "student_id",
+        "defaults": {"priority": "0", "arrival": "0"},
+    },
+}
+
+def _normalizer(table):
+    spec = TABLES[table]
+    fields, defaults = spec["fields"], spec["defaults"]
+
+    def normalize(row):
+        # Ensure minimum structure
+        for k in fields:
+            if k not in row:
+                row[k] = defaults.get(k, '')
+    return normalize
+
+def _delta_path(path):
+    return path.with_name(path.stem + ".delta.csv")
+
+def _read_complete_records(path):
+    """Rows of an append-only CSV, ignoring a record a writer is still appending"""
+    try:
+        with path.open(newline="", encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return []
+    text = text[:text.rfind("\r\n") + 2]
+    return [{k: (v if v is not None else '') for k, v in row.items()}
+            for row in csv.DictReader(io.StringIO(text))]
+
+def _merge_delta(rows, ops, key):
+    """Apply (op, old_key, row) journal entries on top of base rows.
+
+    Replaying ops that were already folded into the base is harmless, so a
+    reader racing a compaction still sees the right rows.
+    """
+    merged = list(rows)
+    index = {}
+    for i, r in enumerate(merged):
+        index.setdefault(r.get(key), []).append(i)
+
+    for op, old_key, row in ops:
+        if op == "D":
+            for i in index.pop(old_key, []):
+                merged[i] = None
+            continue
+        new_key = row[key]
+        match = old_key if old_key and old_key in index else new_key
+        positions = index.get(match)
+        if positions:
+            merged[positions[0]] = row
+            if match != new_key:
+                rest = positions[1:]
+                if rest:
+                    index[match] = rest
+                else:
+                    del index[match]
+                index.setdefault(new_key, []).insert(0, positions[0])
+        else:
+            index[new_key] = [len(merged)]
+            merged.append(row)
+
+    return [r for r in merged if r is not None]
+
+def _delta_ops(table, delta_path):
+    spec = TABLES[table]
+    normalize = _normalizer(table)
+    ops = []
+    for entry in _read_complete_records(delta_path):
+        row = {k: entry.get(k, '') for k in spec["fields"]}
+        normalize(row)
+        ops.append((entry.get("op", "U"), entry.get("old_key", ''), MappingProxyType(row)))
+    return ops
+
+def read_table(table, path):
+    """Rows of a table's CSV file with its <table>.delta.csv applied (fresh dicts, uncached)"""
+    normalize = _normalizer(table)
+    base = read_csv(path)
+    for row in base:
+        normalize(row)
+    return [dict(r) for r in _merge_delta(base, _delta_ops(table, _delta_path(path)), TABLES[table]["key"])]
+
+class CsvBackend:
+    """Default backend: one CSV file per table under data/.
+
+    Single-row writes are appended to <table>.delta.csv (an upsert or a
+    tombstone per line) instead of rewriting the table, so an admin edit is
+    O(1) I/O. Readers merge the delta over the cached base rows, and once
+    the delta grows past COMPACT_AFTER entries a background thread folds it
+    back into the main file.
+    """
+    name = "csv"
+    COMPACT_AFTER = 256
+
+    def __init__(self):
+        self._pending = {}
+        self._compacting = set()
+        for table, spec in TABLES.items():
+            with self.lock(table):
+                recover(spec["file"])
+                recover(_delta_path(spec["file"]))
+
+    def lock(self, table):
+        return file_lock(TABLES[table]["file"])
+
+    def rows(self, table):
+        spec = TABLES[table]
+        base_path, delta_path = spec["file"], _delta_path(spec["file"])
+        sig = (file_signature(base_path), file_signature(delta_path))
+        normalize = _normalizer(table)
+        if sig[1][1] is None:
+            return read_csv_cached(base_path, normalize)
+
+        cache_key = str(delta_path)
+        with _cache_lock:
+            hit = _cache.get(cache_key)
+            if hit is not None and hit[0] == sig:
+                return hit[1]
+
+        base = read_csv_cached(base_path, normalize)
+        merged = tuple(_merge_delta(base, _delta_ops(table, delta_path), spec["key"]))
+
+        with _cache_lock:
+            if (file_signature(base_path), file_signature(delta_path)) == sig:
+                _cache[cache_key] = (sig, merged)
+        return merged
+
+    def version(self, table):
+        path = TABLES[table]["file"]
+        return (file_signature(path), file_signature(_delta_path(path)))
+
+    def exists(self, table):
+        path = TABLES[table]["file"]
+        return path.exists() or _delta_path(path).exists()
+
+    def stable_version(self, table):
+        return tuple(sig[1:] for sig in self.version(table))
+
+    def save(self, table, rows):
+        spec = TABLES[table]
+        with self.lock(table):
+            write_csv(spec["file"], rows, spec["fields"])
+            self._drop_delta(table)
+
+    def _append(self, table, ops):
+        """Journal (op, old_key, row) entries in one append"""
+        spec = TABLES[table]
+        delta_path = _delta_path(spec["file"])
+        lines = [[op, old_key or ''] + [
+            row.get(k, '') if row.get(k) is not None else '' for k in spec["fields"]
+        ] for op, old_key, row in ops]
+        with self.lock(table):
+            if table not in self._pending:
+                self._pending[table] = len(_read_complete_records(delta_path))
+            append_csv_rows(delta_path, lines, ["op", "old_key"] + spec["fields"])
+            self._pending[table] += len(lines)
+            if self._pending[table] >= self.COMPACT_AFTER and table not in self._compacting:
+                self._compacting.add(table)
+                threading.Thread(target=self.compact, args=(table,), daemon=True).start()
+
+    def upsert(self, table, row, old_key=None):
+        self._append(table, [("U", old_key, row)])
+
+    def delete(self, table, key_value):
+        key = TABLES[table]["key"]
+        if any(r.get(key) == key_value for r in self.rows(table)):
+            self._append(table, [("D", key_value, {})])
+
+    def apply_changes(self, table, upserts, deletes):
+        ops = [("U", None, row) for row in upserts] + [("D", k, {}) for k in deletes]
+        if ops:
+            self._append(table, ops)
+
+    def _drop_delta(self, table):
+        delta_path = _delta_path(TABLES[table]["file"])
+        delta_path.unlink(missing_ok=True)
+        invalidate(delta_path)
+        self._pending[table] = 0
+
+    def compact(self, table):
+        """Fold the delta journal back into the table's CSV file"""
+        spec = TABLES[table]
+        try:
+            with self.lock(table):
+                if _delta_path(spec["file"]).exists():
+                    write_csv(spec["file"], self.rows(table), spec["fields"])
+                    self._drop_delta(table)
+        finally:
+            self._compacting.discard(table)
+
+_backend = None
+
+def get_backend():
+    """Active backend, chosen by SMARTDORM_STORAGE=csv|sqlite (default csv)"""
+    global _backend
+    if _backend is None:
+        kind = os.environ.get("SMARTDORM_STORAGE", "csv").lower()
+        if kind == "sqlite":
+            from sqlite_backend import SqliteBackend
+            _backend = SqliteBackend(os.environ.get("SMARTDORM_DB", DATA_DIR / "smartdorm.db"))
+        else:
+            _backend = CsvBackend()
+    return _backend
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+# ------------- Change notifications -------------
+_listeners = []
+
+def on_change(callback):
+    """Register callback(table, changes) to run after every write.
+
+    changes has "inserted", "updated" and "deleted" key sets, or
+    "full": True when the whole table was replaced (a first import still
+    lists the rows it inserted).
+    """
+    _listeners.append(callback)
+    return callback
+
+def _notify(table, inserted=(), updated=(), deleted=(), full=False):
+    changes = {"inserted": set(inserted), "updated": set(updated), "deleted": set(deleted), "full": full}
+    for callback in _listeners:
+        callback(table, changes)
+
+# ------------- Generic table access -------------
+def rows_snapshot(table):
+    """Cached read-only rows of a table (do not mutate)"""
+    return get_backend().rows(table)
+
+def load_rows(table):
+    return [dict(r) for r in rows_snapshot(table)]
+
+def save_rows(table, rows):
+    get_backend().save(table, rows)
+    _notify(table, full=True)
+
+def upsert_row(table, row, old_key=None):
+    """Insert or update one row; old_key lets an edit change the key itself"""
+    get_backend().upsert(table, row, old_key)
+    key_value = row[TABLES[table]["key"]]
+    renamed = [old_key] if old_key is not None and old_key != key_value else []
+    _notify(table, updated=[key_value], deleted=renamed)
+
+def delete_row(table, key_value):
+    get_backend().delete(table, key_value)
+    _notify(table, deleted=[key_value])
+
+def apply_rows(table, upserts, deletes=()):
+    """Upsert and delete many rows in one write"""
+    key = TABLES[table]["key"]
+    get_backend().apply_changes(table, upserts, deletes)
+    _notify(table, updated=[r[key] for r in upserts], deleted=deletes)
+
+def table_lock(table):
+    """Hold while doing read-modify-write on a table (e.g. picking the next id)"""
+    return get_backend().lock(table)
+
+def table_exists(table):
+    """Whether the table was ever written (an empty table still exists)"""
+    return get_backend().exists(table)
+
+def data_version(*tables):
+    """Combined version of the given tables, for cache keys and ETags"""
+    tables = tables or ("students", "dorms", "allocations")
+    backend = get_backend()
+    return tuple(backend.version(t) for t in tables)
+
+# ------------- Export -------------
+EXPORT_DIR = DATA_DIR / "exports"
+EXPORT_CHUNK_ROWS = 2000
+
+def table_etag(table):
+    """Short tag that changes whenever the table does, identical across workers"""
+    return hashlib.blake2b(repr(get_backend().stable_version(table)).encode(), digest_size=8).hexdigest()
+
+def iter_export_chunks(table, compress=False):
+    """CSV bytes for a table, produced lazily EXPORT_CHUNK_ROWS rows at a time"""
+    rows = rows_snapshot(table)
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=TABLES[table]["fields"], extrasaction="ignore")
+    writer.writeheader()
+    for start in range(0, len(rows) or 1, EXPORT_CHUNK_ROWS):
+        writer.writerows(rows[start:start + EXPORT_CHUNK_ROWS])
+        data = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+        if gz:
+            data = gz.compress(data)
+        if data:
+            yield data
+    if gz:
+        yield gz.flush()
+
+def export_cache_path(table, etag, compress=False):
+    return EXPORT_DIR / f"{table}-{etag}.csv{'.gz' if compress else ''}"
+
+def iter_export_to_cache(table, etag, compress=False):
+    """Stream an export while saving it, so the next download of this version is a plain file.
+
+    The cache file only appears once the whole export was produced; older
+    versions of the table's exports are removed at that point.
+    """
+    path = export_cache_path(table, etag, compress)
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=EXPORT_DIR, prefix="." + path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter_export_chunks(table, compress):
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_name, path)
+        for old in EXPORT_DIR.glob(f"{table}-*.csv*"):
+            if not old.name.startswith(f"{table}-{etag}."):
+                old.unlink(missing_ok=True)
+    finally:
+        Path(tmp_name).unlink(missing_ok=True)
+
+# ------------- Binary roster snapshot -------------
+ROSTER_SNAPSHOT_FILE = DATA_DIR / "students.roster"
+_roster = None
+_roster_lock = threading.Lock()
+
+def write_roster_snapshot(path=ROSTER_SNAPSHOT_FILE):
+    """Encode the current students into the binary snapshot format (see snapshot.py)"""
+    from snapshot import write_snapshot
+
+    source = table_etag("students")
+    students = students_snapshot()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(path):
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix="." + path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write_snapshot(f, students, source)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_name, path)
+        finally:
+            Path(tmp_name).unlink(missing_ok=True)
+    return source
+
+def load_roster_snapshot(path=ROSTER_SNAPSHOT_FILE):
+    """Memory-mapped RosterSnapshot of the current students.
+
+    The file is rebuilt only when the students table has changed since it
+    was written, so worker processes normally just map the existing file.
+    """
+    global _roster
+    from snapshot import RosterSnapshot
+
+    current = table_etag("students")
+    with _roster_lock:
+        if _roster is not None and _roster.source == current and _roster.path == path:
+            return _roster
+        roster = None
+        if path.exists():
+            try:
+                roster = RosterSnapshot(path)
+            except ValueError:
+                roster = None
+            if roster is not None and roster.source != current:
+                roster = None
+        if roster is None:
+            write_roster_snapshot(path)
+            roster = RosterSnapshot(path)
+        # The old mapping stays valid for anyone still holding it
+        _roster = roster
+        return roster
+
+_roster_refresh = threading.Lock()
+
+def _refresh_roster(path):
+    if not _roster_refresh.acquire(blocking=False):
+        return  # a rebuild is already running; it re-checks when done
+    try:
+        # Students may change while the file is written; go again until it is current
+        while load_roster_snapshot(path).source != table_etag("students"):
+            pass
+    finally:
+        _roster_refresh.release()
+
+def current_roster_snapshot(path=ROSTER_SNAPSHOT_FILE):
+    """The roster snapshot if it matches the current students, else None.
+
+    Never writes in the caller's thread: a stale or missing snapshot is
+    rebuilt on a background thread, so callers fall back to parsing rows
+    until it is ready rather than waiting for it.
+    """
+    from snapshot import RosterSnapshot
+
+    current = table_etag("students")
+    roster = _roster
+    if roster is None and path.exists():
+        # A file left by an earlier run is used if it is still current
+        try:
+            roster = RosterSnapshot(path)
+        except ValueError:
+            roster = None
+    if roster is not None and roster.source == current and roster.path == path:
+        return roster
+    threading.Thread(target=_refresh_roster, args=(path,), daemon=True).start()
+    return None
+
+# ------------- Datasets -------------
+def students_snapshot():
+    """Cached read-only student rows (do not mutate)"""
+    return rows_snapshot("students")
+
+def dorms_snapshot():
+    """Cached read-only dorm rows (do not mutate)"""
+    return rows_snapshot("dorms")
 
 def load_students():
-    students = read_csv(STUDENTS_FILE)
-    # Ensure minimum structure
-    for s in students:
-        if 'student_id' not in s:
-            s['student_id'] = ''
-        if 'name' not in s:
-            s['name'] = ''
-        if 'year' not in s:
-            s['year'] = '1'
-        if 'priority' not in s:
-            s['priority'] = '0'
-        if 'preferred_dorms' not in s:
-            s['preferred_dorms'] = ''
-        if 'tags' not in s:
-            s['tags'] = ''
-    return students
+    return load_rows("students")
 
 def save_students(students):
-    fieldnames = ["student_id", "name", "year", "priority", "preferred_dorms", "tags"]
-    write_csv(STUDENTS_FILE, students, fieldnames)
+    save_rows("students", students)
 
 def load_dorms():
-    return read_csv(DORMS_FILE)
+    return load_rows("dorms")
 
 def save_dorms(dorms):
-    fieldnames = ["dorm_id", "name", "capacity", "attributes"]
-    write_csv(DORMS_FILE, dorms, fieldnames)
+    save_rows("dorms", dorms)
 
 def save_allocation(allocation):
     rows = [{"student_id": sid, "dorm_id": did if did else ""} for sid, did in allocation.items()]
-    fieldnames = ["student_id", "dorm_id"]
-    write_csv(ALLOC_FILE, rows, fieldnames)
+    save_rows("allocations", rows)
+
+def load_allocation():
+    """Current allocation as {student_id: dorm_id} (a fresh dict each call)"""
+    return {a["student_id"]: a["dorm_id"] for a in rows_snapshot("allocations")}
+
+def load_tickets():
+    return load_rows("tickets")
+
+def save_tickets(tickets):
+    save_rows("tickets", tickets)
+
+def load_room_requests():
+    return load_rows("room_requests")
+
+def save_room_requests(requests):
+    save_rows("room_requests", requests)
+
+# ------------- Streaming import -------------
+IMPORT_CHUNK_ROWS = 1000
+MAX_REPORTED_REJECTS = 200
+
+def _is_int(value):
+    try:
+        int(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def _check_student(row):
+    if not valid_student_id(row["student_id"]):
+        return "invalid student_id checksum"
+    if not _is_int(row["year"]):
+        return f"year is not a number: {row['year']!r}"
+    if not _is_int(row["priority"]):
+        return f"priority is not a number: {row['priority']!r}"
+    return None
+
+def _check_dorm(row):
+    if not _is_int(row["capacity"]) or int(row["capacity"]) < 0:
+        return f"capacity is not a non-negative number: {row['capacity']!r}"
+    return None
+
+IMPORT_CHECKS = {"students": _check_student, "dorms": _check_dorm}
+
+def iter_import_rows(table, text_stream, report, seen=None, rejected=None):
+    """Validated, de-duplicated rows from an uploaded CSV, read chunk by chunk.
+
+    Only one chunk and the set of ids seen so far are held in memory.
+    Rejected rows are counted in report (details for the first
+    MAX_REPORTED_REJECTS). Raises ValueError - before anything has been
+    written - if the header lacks the key column, and at the end if no row
+    was valid, so a bad upload never wipes the table. The keys of rejected
+    rows are added to rejected when given.
+    """
+    spec = TABLES[table]
+    key = spec["key"]
+    check = IMPORT_CHECKS[table]
+    normalize = _normalizer(table)
+
+    reader = csv.DictReader(text_stream)
+    header = [(f or "").strip() for f in (reader.fieldnames or [])]
+    if key not in header:
+        raise ValueError(f"CSV header must include '{key}'")
+    reader.fieldnames = header
+
+    def reject(row_no, key_value, reason):
+        report["rejected"] += 1
+        if rejected is not None and key_value:
+            rejected.add(key_value)
+        if len(report["rejects"]) < MAX_REPORTED_REJECTS:
+            report["rejects"].append({"row": row_no, "key": key_value, "reason": reason})
+
+    seen = set() if seen is None else seen
+    row_no = 0
+    while True:
+        chunk = list(islice(reader, IMPORT_CHUNK_ROWS))
+        if not chunk:
+            break
+        for raw in chunk:
+            row_no += 1
+            row = {k: (raw.get(k) or '').strip() for k in spec["fields"] if raw.get(k) is not None}
+            normalize(row)
+            key_value = row[key]
+            if not key_value:
+                reject(row_no, key_value, f"missing {key}")
+                continue
+            if key_value in seen:
+                reject(row_no, key_value, f"duplicate {key}")
+                continue
+            reason = check(row)
+            if reason:
+                reject(row_no, key_value, reason)
+                continue
+            seen.add(key_value)
+            report["imported"] += 1
+            yield row
+
+    if not report["imported"]:
+        raise ValueError("no valid rows in upload")
+
+DELTA_BATCH_ROWS = 10000
+
+def row_hash(table, row):
+    """Short digest of a row's values, for spotting changed rows between uploads"""
+    values = "\x1f".join(str(row.get(k, '')) for k in TABLES[table]["fields"])
+    return hashlib.blake2b(values.encode("utf-8"), digest_size=8).digest()
+
+def import_csv(table, text_stream):
+    """Bring a table in line with an uploaded CSV, writing only what changed.
+
+    Rows are matched on the table key and compared by row_hash; only inserts,
+    updates and deletes reach the backend (in batches of DELTA_BATCH_ROWS),
+    and listeners get the changed keys. The report carries the same keys.
+    Existing rows whose upload was rejected stay unchanged.
+    """
+    key = TABLES[table]["key"]
+    report = {"imported": 0, "rejected": 0, "rejects": [],
+              "inserted": [], "updated": [], "deleted": [], "unchanged": 0}
+    seen, rejected = set(), set()
+    rows = iter_import_rows(table, text_stream, report, seen, rejected)
+
+    with table_lock(table):
+        current = {r[key]: row_hash(table, r) for r in rows_snapshot(table)}
+        if not current:
+            # First load: nothing to diff against, stream the whole table in
+            get_backend().save(table, rows)
+            report["inserted"] = list(seen)
+            _notify(table, inserted=seen, full=True)
+            return report
+
+        backend = get_backend()
+        pending = []
+        for row in rows:
+            old = current.get(row[key])
+            if old is None:
+                report["inserted"].append(row[key])
+                pending.append(row)
+            elif old != row_hash(table, row):
+                report["updated"].append(row[key])
+                pending.append(row)
+            else:
+                report["unchanged"] += 1
+            if len(pending) >= DELTA_BATCH_ROWS:
+                backend.apply_changes(table, pending, ())
+                pending = []
+        # A row that failed validation is kept as it is, not deleted
+        report["deleted"] = [k for k in current if k not in seen and k not in rejected]
+        backend.apply_changes(table, pending, report["deleted"])
+
+    _notify(table, report["inserted"], report["updated"], report["deleted"])
+    return report
 
 def import_students_from_file(file_path):
     return read_csv(file_path)
@@ -0,0 +1,111 @@
+# strategies.py - registered allocation strategies and concurrent comparison
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from models import (
+    as_students, as_dorms, greedy_allocation, random_allocation, priority_allocation,
+    stable_allocation, compute_fairness_metrics,
+)
+from optimal import optimal_allocation
+from scoring import ScoreMatrix
+
+MAX_SEEDS = 20
+POOL_MIN_WORK = 200_000  # students x runs below which a pool costs more than it saves
+
+# ------------- Registry -------------
+Strategy = namedtuple("Strategy", "key name func seeded")
+STRATEGIES = {}
+
+def register_strategy(key, name, func, seeded=False):
+    """Make func(students, dorms, scores=...) available to /allocate and /compare.
+
+    seeded strategies also take rng=random.Random(seed) and are compared
+    over several seeds.
+    """
+    STRATEGIES[key] = Strategy(key, name, func, seeded)
+    return func
+
+register_strategy("greedy", "Smart Greedy", greedy_allocation, seeded=True)
+register_strategy("random", "Random", random_allocation, seeded=True)
+register_strategy("priority", "Priority-first", priority_allocation)
+register_strategy("stable", "Stable Matching", stable_allocation)
+register_strategy("optimal", "Optimal", optimal_allocation)
+
+def run_strategy(key, students, dorms, scores=None, seed=None):
+    strategy = STRATEGIES[key]
+    if strategy.seeded and seed is not None:
+        return strategy.func(students, dorms, scores=scores, rng=random.Random(seed))
+    return strategy.func(students, dorms, scores=scores)
+
+# ------------- Comparison -------------
+_context = None  # (students, dorms, scores) inside pool workers
+
+def _attach(students, dorms, scores):
+    global _context
+    _context = (as_students(students), as_dorms(dorms), scores)
+
+def _evaluate(context, key, seed):
+    students, dorms, scores = context
+    started = time.perf_counter()
+    allocation = run_strategy(key, students, dorms, scores=scores, seed=seed)
+    seconds = time.perf_counter() - started
+    metrics = compute_fairness_metrics(students, allocation)
+    metrics["unallocated"] = sum(1 for s in students if not allocation.get(s.student_id))
+    return key, seed, metrics, seconds
+
+def _worker_evaluate(task):
+    return _evaluate(_context, *task)
+
+def compare(students, dorms, keys=None, seeds=1, workers=None, scores=None):
+    """Run every strategy in keys (all registered by default) on one shared context.
+
+    The roster is parsed and scored once; seeded strategies run once per
+    seed 0..seeds-1 and report their mean metrics. Runs are spread over a
+    process pool, each worker receiving the context once, so adding
+    strategies does not add their run times up on the page. Returns
+    {"rows": [...], "workers": n, "seconds": wall time}, each row holding
+    a strategy's averaged metrics and mean seconds per run.
+    """
+    started = time.perf_counter()
+    keys = list(keys or STRATEGIES)
+    seeds = max(1, min(int(seeds), MAX_SEEDS))
+    students, dorms = as_students(students), as_dorms(dorms)
+    if scores is None:
+        scores = ScoreMatrix.build(students, dorms)
+    tasks = [(key, seed) for key in keys
+             for seed in (range(seeds) if STRATEGIES[key].seeded else [None])]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers > 1 and len(students) * len(tasks) < POOL_MIN_WORK:
+        workers = 1
+
+    if workers == 1:
+        context = (students, dorms, scores)
+        results = [_evaluate(context, *task) for task in tasks]
+    else:
+        # Plain dicts: snapshot rows are read-only proxies that do not pickle.
+        # Plain matrix too: a cached ranking holds memoryviews, which do not pickle either
+        shared = ScoreMatrix(scores.matrix, scores.student_ids, scores.dorm_ids, scores.valid)
+        initargs = ([dict(s.row) for s in students], [dict(d.row) for d in dorms], shared)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=initargs) as pool:
+            results = list(pool.map(_worker_evaluate, tasks))
+
+    rows = {}
+    for key, seed, metrics, seconds in results:
+        row = rows.setdefault(key, {"key": key, "name": STRATEGIES[key].name, "runs": 0, "seconds": 0.0,
+                                    **dict.fromkeys(metrics, 0)})
+        row["runs"] += 1
+        row["seconds"] += seconds
+        for name, value in metrics.items():
+            row[name] += value
+    for row in rows.values():
+        for name in ("seconds", "top1_rate", "top3_rate", "envy_pairs", "unallocated"):
+            row[name] /= row["runs"]
+    return {
+        "rows": [rows[key] for key in keys],
+        "workers": workers,
+        "seeds": seeds,
+        "seconds": time.perf_counter() - started,
+    }
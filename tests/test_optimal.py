@@ -0,0 +1,89 @@
+# tests/test_optimal.py - optimal.assign and optimal_allocation against exhaustive search
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from models import compatibility_score
+from optimal import assign, optimal_allocation
+from utils import compute_checksum
+
+def brute_force_assign(benefit, capacity):
+    """Best total benefit over every assignment, by DP over rows keeping each column's head count"""
+    best = {(0,) * len(capacity): 0}
+    for row in benefit.tolist():
+        step = {}
+        for counts, total in best.items():
+            for k, value in enumerate(row):
+                if counts[k] < capacity[k]:
+                    after = counts[:k] + (counts[k] + 1,) + counts[k + 1:]
+                    if step.get(after, -1) < total + value:
+                        step[after] = total + value
+        best = step
+    return max(best.values())
+
+def check_assign(benefit, capacity):
+    col = assign(benefit, capacity)
+    assert len(col) == len(benefit)
+    assert (np.bincount(col, minlength=len(capacity)) <= capacity).all()
+    assert int(benefit[np.arange(len(benefit)), col].sum()) == brute_force_assign(benefit, capacity)
+
+@pytest.mark.parametrize("values", [100, 3])
+def test_assign_matches_brute_force(values):
+    rng = np.random.default_rng(values)
+    for _ in range(300):
+        S, K = int(rng.integers(1, 9)), int(rng.integers(1, 5))
+        capacity = rng.integers(0, S + 1, size=K)
+        capacity[rng.integers(K)] += max(0, S - capacity.sum())
+        check_assign(rng.integers(0, values, size=(S, K)), capacity)
+
+def test_assign_moves_tied_groups():
+    # Skewed, tie-heavy benefits: many rows share their move costs, so
+    # augmenting paths carry several rows at once
+    rng = np.random.default_rng(1)
+    for _ in range(60):
+        S, K = int(rng.integers(10, 40)), 3
+        kinds = rng.integers(0, 4, size=(4, K))
+        benefit = kinds[rng.choice(4, size=S, p=[0.55, 0.25, 0.15, 0.05])]
+        capacity = rng.multinomial(S, [0.2, 0.3, 0.5]) + rng.integers(0, 3, size=K)
+        check_assign(benefit, capacity)
+
+def _students(rng, n, dorm_ids):
+    return [{
+        "student_id": compute_checksum(str(100000 + i)),
+        "name": f"S{i}",
+        "year": str(rng.randint(1, 4)),
+        "priority": str(rng.randint(0, 3)),
+        "preferred_dorms": ",".join(rng.sample(dorm_ids, rng.randint(0, len(dorm_ids)))),
+        "tags": rng.choice(["", "quiet", "studious", "quiet,studious"]),
+    } for i in range(n)]
+
+def test_optimal_allocation_matches_brute_force():
+    rng = random.Random(0)
+    for _ in range(150):
+        dorms = [{"dorm_id": f"D{k}", "name": f"Hall {k}", "capacity": str(rng.randint(0, 3)),
+                  "attributes": rng.choice(["", "quiet", "near_library", "quiet,near_library"])}
+                 for k in range(rng.randint(1, 3))]
+        students = _students(rng, rng.randint(1, 6), [d["dorm_id"] for d in dorms])
+        allocation = optimal_allocation(students, dorms)
+
+        capacity = {d["dorm_id"]: int(d["capacity"]) for d in dorms}
+        placed = [s for s in students if allocation[s["student_id"]]]
+        assert len(allocation) == len(students)
+        assert len(placed) == min(len(students), sum(capacity.values()))
+        for did, cap in capacity.items():
+            assert sum(1 for s in placed if allocation[s["student_id"]] == did) <= cap
+
+        def total(choice):
+            return sum(compatibility_score(s, dorms[k]) for s, k in zip(students, choice) if k is not None)
+
+        # Every valid student gets a bed while beds remain; among those
+        # allocations the total score is the best possible
+        best = max(total(choice) for choice in itertools.product([None] + list(range(len(dorms))),
+                                                                 repeat=len(students))
+                   if sum(k is not None for k in choice) == len(placed)
+                   and all(sum(k == j for k in choice) <= int(d["capacity"]) for j, d in enumerate(dorms)))
+        got = sum(compatibility_score(s, next(d for d in dorms if d["dorm_id"] == allocation[s["student_id"]]))
+                  for s in placed)
+        assert got == best
@@ -0,0 +1,74 @@
+# tests/test_pairing.py - max_weight_matching and pair_dorm against brute force on small graphs
+import random
+from functools import lru_cache
+
+import pytest
+
+from models import roommate_compatibility
+from pairing import max_weight_matching, pair_dorm
+
+def brute_force_matching(weight):
+    """Best total weight over every matching, by DP over the unmatched set"""
+    n = len(weight)
+
+    @lru_cache(maxsize=None)
+    def best(left):
+        if not left:
+            return 0
+        i = (left & -left).bit_length() - 1
+        rest = left & ~(1 << i)
+        result = best(rest)  # i stays single
+        for j in range(i + 1, n):
+            if rest >> j & 1:
+                result = max(result, weight[i][j] + best(rest & ~(1 << j)))
+        return result
+
+    return best((1 << n) - 1)
+
+def random_weights(rng, n, low, high):
+    weight = [[0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            weight[i][j] = weight[j][i] = rng.randint(low, high)
+    return weight
+
+def check_matching(weight, mate):
+    n = len(weight)
+    assert len(mate) == n
+    for i, m in enumerate(mate):
+        if m != -1:
+            assert m != i and mate[m] == i
+    return sum(weight[i][m] for i, m in enumerate(mate) if m > i)
+
+@pytest.mark.parametrize("low,high", [(0, 100), (0, 3), (-20, 20), (50, 55)])
+def test_max_weight_matching_matches_brute_force(low, high):
+    rng = random.Random(f"{low}:{high}")
+    for _ in range(150):
+        weight = random_weights(rng, rng.randint(0, 11), low, high)
+        mate = max_weight_matching(weight)
+        assert check_matching(weight, mate) == brute_force_matching(weight)
+
+def test_max_weight_matching_skips_negative_edges():
+    weight = [[0, -5, -1], [-5, 0, -2], [-1, -2, 0]]
+    assert max_weight_matching(weight) == [-1, -1, -1]
+
+def test_pair_dorm_matches_brute_force():
+    rng = random.Random(0)
+    tags = ["quiet", "studious", "party", "athlete", "music"]
+    for _ in range(100):
+        students = [{
+            "student_id": str(i),
+            "name": rng.choice(["Alice", "Anna", "Bob", "Ben", "Cara"]),
+            "year": str(rng.randint(1, 4)),
+            "priority": str(rng.randint(0, 3)),
+            "preferred_dorms": "",
+            "tags": ",".join(t for t in tags if rng.random() < 0.3),
+        } for i in range(rng.randint(1, 11))]
+        weight = [[roommate_compatibility(a, b) if a is not b else 0 for b in students] for a in students]
+        rows = pair_dorm(students)
+        assert [s.student_id for s, _, _ in rows] == [s["student_id"] for s in students]
+        partner = {s.student_id: r.student_id for s, r, _ in rows if r is not None}
+        assert all(partner[r] == s for s, r in partner.items())
+        assert sum(score for _, r, score in rows if r is not None) == 2 * brute_force_matching(weight)
+        # Everyone who can be paired is: scores are at least 50
+        assert len(students) - len(partner) == len(students) % 2
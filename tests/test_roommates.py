@@ -0,0 +1,40 @@
+# tests/test_roommates.py - suggest_roommates (RoommateIndex) against the all-pairs scan it replaced
+import random
+
+import pytest
+
+from models import as_students, roommate_compatibility, suggest_roommates, _roommate_pair
+
+def all_pairs_suggestions(students, max_pairs=10):
+    """The original O(n^2) suggest_roommates: each student's best later partner, 60+ only"""
+    if len(students) < 2:
+        return []
+    students = as_students(students)
+    pairs = []
+    for i, s1 in enumerate(students):
+        best_match, best_score = None, 0
+        for s2 in students[i + 1:]:
+            score = roommate_compatibility(s1, s2)
+            if score > best_score:
+                best_match, best_score = s2, score
+        if best_match and best_score >= 60:
+            pairs.append(_roommate_pair(s1, best_match, best_score))
+    return sorted(pairs, key=lambda x: int(x["compatibility"][:-1]), reverse=True)[:max_pairs]
+
+def random_roster(rng, n):
+    tags = ["quiet", "studious", "party", "athlete", "Quiet", ""]
+    return [{
+        "student_id": str(100000 + i),
+        "name": rng.choice(["Alice", "alan", "Bob", "Ben", "Cara", "Dan"]) + str(i),
+        "year": rng.choice(["1", "2", "3", "4"]),
+        "priority": rng.choice(["0", "1", "2", "3"]),
+        "preferred_dorms": "",
+        "tags": ",".join(rng.sample(tags, rng.randint(0, 3))),
+    } for i in range(n)]
+
+@pytest.mark.parametrize("max_pairs", [0, 1, 3, 10, 1000])
+def test_suggest_roommates_matches_all_pairs_scan(max_pairs):
+    rng = random.Random(max_pairs)
+    for _ in range(60):
+        students = random_roster(rng, rng.randint(0, 80))
+        assert suggest_roommates(students, max_pairs) == all_pairs_suggestions(students, max_pairs)
@@ -0,0 +1,207 @@
+# waitlist.py - unplaced students in a persistent priority queue
+import heapq
+
+from models import _int_or_none, _student, as_students, parse_prefs
+from storage import (
+    on_change, rows_snapshot, save_rows, upsert_row, apply_rows, table_lock, data_version,
+    table_exists, students_snapshot, load_allocation,
+)
+
+class Waitlist:
+    """Students without a bed, highest priority first and then by arrival.
+
+    The queue is stored in the waitlist table and mirrored in memory as one
+    heap of everyone plus a heap per dorm of the students listing it, so a
+    freed bed goes to the best waiting student who wants that dorm, or to
+    the best waiting student overall when nobody listed it. Removals are
+    lazy: heap entries whose student left the queue are skipped when they
+    reach the top, and the heaps are rebuilt once stale entries outnumber
+    live ones. Every operation is O(log N) amortised. Until the table is
+    first written, the queue is seeded from the students and the stored
+    allocation.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.entries = {}    # student_id -> (-priority, arrival, push count)
+        self.everyone = []   # (-priority, arrival, push count, student_id)
+        self.wanting = {}    # dorm_id -> heap of the same tuples
+        self.info = {}       # student_id -> (name, preferred dorm ids)
+        self.next_arrival = 0
+        # Tells a re-queued student's entry from their old ones still in the heaps
+        self.pushes = 0
+
+    def _sync(self):
+        version = data_version("waitlist")
+        if version == self.version:
+            return
+        if not table_exists("waitlist"):
+            # First run: queue everyone the stored allocation leaves without a bed
+            self.reset(as_students(students_snapshot()), load_allocation())
+            version = data_version("waitlist")
+        self.entries, self.info = {}, {}
+        for r in rows_snapshot("waitlist"):
+            self.pushes += 1
+            self.entries[r["student_id"]] = (-(_int_or_none(r["priority"]) or 0), int(r["arrival"]), self.pushes)
+            self.info[r["student_id"]] = (r["name"], tuple(parse_prefs(r["preferred_dorms"])))
+        self.next_arrival = max((a for _, a, _ in self.entries.values()), default=-1) + 1
+        self._rebuild_heaps()
+        self.version = version
+
+    def _rebuild_heaps(self):
+        self.everyone = [(*key, sid) for sid, key in self.entries.items()]
+        heapq.heapify(self.everyone)
+        self.wanting = {}
+        for entry in self.everyone:
+            for dorm_id in set(self.info[entry[3]][1]):
+                self.wanting.setdefault(dorm_id, []).append(entry)
+        for heap in self.wanting.values():
+            heapq.heapify(heap)
+
+    def _live(self, entry):
+        return self.entries.get(entry[3]) == entry[:3]
+
+    def _push(self, entry):
+        heapq.heappush(self.everyone, entry)
+        for dorm_id in set(self.info[entry[3]][1]):
+            heapq.heappush(self.wanting.setdefault(dorm_id, []), entry)
+
+    def _pop_live(self, heap):
+        while heap:
+            entry = heapq.heappop(heap)
+            if self._live(entry):
+                return entry[3]
+        return None
+
+    def _forget(self, student_id):
+        del self.entries[student_id]
+        del self.info[student_id]
+        if len(self.everyone) > 2 * len(self.entries) + 32:
+            self._rebuild_heaps()
+
+    def __len__(self):
+        with table_lock("waitlist"):
+            self._sync()
+            return len(self.entries)
+
+    def _enqueue(self, student, arrival=None):
+        s = _student(student)
+        if arrival is None:
+            old = self.entries.get(s.student_id)
+            arrival = old[1] if old else self.next_arrival
+        self.next_arrival = max(self.next_arrival, arrival + 1)
+        self.pushes += 1
+        entry = (-(_int_or_none(s.get("priority")) or 0), arrival, self.pushes, s.student_id)
+        self.entries[s.student_id] = entry[:3]
+        self.info[s.student_id] = (s.name, s.prefs)
+        self._push(entry)
+        return {
+            "student_id": s.student_id,
+            "name": s.name,
+            "priority": str(-entry[0]),
+            "preferred_dorms": ",".join(s.prefs),
+            "arrival": str(arrival),
+        }
+
+    def add(self, student, arrival=None):
+        """Queue a student (again); arrival keeps an earlier place in line"""
+        with table_lock("waitlist"):
+            self._sync()
+            upsert_row("waitlist", self._enqueue(student, arrival))
+            self.version = data_version("waitlist")
+
+    def add_many(self, students):
+        """add() for many students in roster order, written in one batch"""
+        with table_lock("waitlist"):
+            self._sync()
+            rows = [self._enqueue(s) for s in students]
+            if rows:
+                apply_rows("waitlist", rows)
+                self.version = data_version("waitlist")
+
+    def remove(self, student_id):
+        """Take a student out of the queue; returns their arrival or None"""
+        with table_lock("waitlist"):
+            self._sync()
+            if student_id not in self.entries:
+                return None
+            arrival = self.entries[student_id][1]
+            self._forget(student_id)
+            apply_rows("waitlist", [], [student_id])
+            self.version = data_version("waitlist")
+            return arrival
+
+    def remove_many(self, student_ids):
+        """remove() for many students, written in one batch"""
+        with table_lock("waitlist"):
+            self._sync()
+            gone = [sid for sid in dict.fromkeys(student_ids) if sid in self.entries]
+            for sid in gone:
+                self._forget(sid)
+            if gone:
+                apply_rows("waitlist", [], gone)
+                self.version = data_version("waitlist")
+
+    def pop_for(self, dorm_id):
+        """Best waiting student for a bed in dorm_id, removed from the queue.
+
+        Students who listed dorm_id come first; anyone may take it otherwise,
+        as the greedy allocation would.
+        """
+        with table_lock("waitlist"):
+            self._sync()
+            student_id = self._pop_live(self.wanting.get(dorm_id, []))
+            if student_id is None:
+                student_id = self._pop_live(self.everyone)
+            if student_id is None:
+                return None
+            self._forget(student_id)
+            apply_rows("waitlist", [], [student_id])
+            self.version = data_version("waitlist")
+            return student_id
+
+    def page(self, start, count):
+        """Waitlist rows ranked start .. start+count-1, in queue order.
+
+        Walks the heap best-first from the root instead of sorting it, so a
+        page costs O((start + count) log) however long the queue is.
+        """
+        with table_lock("waitlist"):
+            self._sync()
+            heap, ranked = self.everyone, []
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier and len(ranked) < start + count:
+                entry, i = heapq.heappop(frontier)
+                if self._live(entry):
+                    ranked.append(entry)
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+            return [{"student_id": sid, "name": self.info[sid][0], "priority": -p,
+                     "position": start + n + 1, "preferred_dorms": self.info[sid][1]}
+                    for n, (p, _, _, sid) in enumerate(ranked[start:])]
+
+    def reset(self, students, allocation):
+        """Queue every valid student the allocation left without a bed, in roster order"""
+        rows, queued = [], set()
+        for s in students:
+            if s.valid and not allocation.get(s.student_id) and s.student_id not in queued:
+                queued.add(s.student_id)
+                rows.append({
+                    "student_id": s.student_id,
+                    "name": s.name,
+                    "priority": str(_int_or_none(s.get("priority")) or 0),
+                    "preferred_dorms": ",".join(s.prefs),
+                    "arrival": str(len(rows)),
+                })
+        with table_lock("waitlist"):
+            save_rows("waitlist", rows)
+
+waitlist = Waitlist()
+
+@on_change
+def _requeue_on_allocation(table, changes):
+    # A full allocation run replaces the queue; single-row changes go through placement
+    if table == "allocations" and changes["full"]:
+        allocation = {r["student_id"]: r["dorm_id"] for r in rows_snapshot("allocations")}
+        waitlist.reset(as_students(students_snapshot()), allocation)